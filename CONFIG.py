@@ -1,23 +1,151 @@
 import os
+import time
+from dataclasses import astuple, dataclass
 
 BASE_URL = "https://blast.ncbi.nlm.nih.gov/Blast.cgi"
+CONFIG_PATH = 'config'
+PROGRAMS = ("blastn", "blastp", "blastx", "tblastn", "tblastx")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Search and report settings from the config file, one line each in this order"""
+    filter: str
+    hitlist_size: int
+    program: str
+    database: str
+    non_anomaly_keyword: str
+    species_name: str
+
+    @classmethod
+    def parse(cls, text):
+        lines = [line.strip() for line in text.splitlines()]
+        if len(lines) < 6:
+            raise ValueError(f"config needs 6 lines, found {len(lines)}")
+        filter_, hitlist_size, program, database, keyword, species = lines[:6]
+        if not hitlist_size.isdigit() or int(hitlist_size) < 1:
+            raise ValueError(f"config hitlist size must be a positive integer, got {hitlist_size!r}")
+        if program not in PROGRAMS:
+            raise ValueError(f"config program must be one of {', '.join(PROGRAMS)}, got {program!r}")
+        if not database:
+            raise ValueError("config database is empty")
+        return cls(filter_, int(hitlist_size), program, database, keyword, species)
+
+    def dump(self):
+        return "\n".join(str(value) for value in astuple(self))
 
-def load_config():
-    if not os.path.exists('config'):
-        with open('config', 'w+') as f:
-            f.write('mL\n1000\nblastn\nnt\nbos taurus\nsus scrofa') # filter, output qty, program, database, non anomaly keyword, report species name
-        return ["mL", 1000, "blastn", "nt", "sus scrofa", "Sample"]
-    else:
-        configs_ = []
-        configs = []
-        with open('config', 'r') as f:
-            configs_ = f.readlines()
-        for config in configs_:
-            configs.append(config.replace('\n', ''))
-        return configs[0], configs[1], configs[2], configs[3], configs[4], configs[5]
 
+DEFAULT_SETTINGS = Settings("mL", 1000, "blastn", "nt", "sus scrofa", "Sample")
+
+_settings = None
+_settings_mtime = None
+_settings_checked = 0.0
+
+def get_settings():
+    """Return the cached settings, reloading them when the config file changed.
+
+    The file is stat'ed at most once per config_check_interval. An invalid
+    edit is reported and the previous settings stay in use.
+    """
+    global _settings, _settings_mtime, _settings_checked
+    now = time.monotonic()
+    if _settings is not None and now - _settings_checked < CONFIG['config_check_interval']:
+        return _settings
+    _settings_checked = now
+    try:
+        mtime = os.stat(CONFIG_PATH).st_mtime_ns
+    except FileNotFoundError:
+        with open(CONFIG_PATH, 'w') as f:
+            f.write(DEFAULT_SETTINGS.dump())
+        mtime = os.stat(CONFIG_PATH).st_mtime_ns
+    if mtime == _settings_mtime:
+        return _settings
+    with open(CONFIG_PATH, 'r') as f:
+        text = f.read()
+    try:
+        settings = Settings.parse(text)
+    except ValueError as e:
+        if _settings is None:
+            raise
+        print(f"Ignoring invalid config file: {e}")
+        _settings_mtime = mtime
+        return _settings
+    _settings, _settings_mtime = settings, mtime
+    return _settings
+
+def load_config():
+    """Settings as the old (filter, hitlist size, program, database, keyword, species) tuple"""
+    return astuple(get_settings())
 
 
 CONFIG = {
-    'normal_sample_size': 5
+    'normal_sample_size': 5,
+    # shared NCBI http client
+    'http_max_connections': 20,
+    'http_max_keepalive_connections': 10,
+    'http_keepalive_expiry': 30.0,
+    'http_timeout': 60.0,
+    # query chunking, each chunk is submitted as its own RID
+    'chunk_max_sequences': 25,
+    'chunk_max_bytes': 100000,
+    'max_parallel_rids': 4,
+    'chunk_retries': 2,
+    # where searches run, 'ncbi' (URL API) or 'local' (BLAST+ on this machine)
+    'blast_backend': 'ncbi',
+    'local_blast_bin_dir': '',  # empty uses blastn/blastp from PATH
+    'local_blast_db': None,  # path of the local database, None uses the database line of the config file
+    'local_blast_threads': 4,  # -num_threads of each process
+    'local_blast_workers': 2,  # BLAST+ processes running at once
+    # k-mer prefilter, sequences that clearly match this reference FASTA are not searched
+    'prefilter_reference': None,
+    'prefilter_k': 21,
+    'prefilter_threshold': 0.9,  # share of a query's distinct k-mers that must be in the reference
+    'prefilter_min_kmers': 20,  # shorter queries are always searched
+    # shared RID poll scheduler
+    'poll_initial_delay': 15.0,  # used when NCBI does not send an RTOE
+    'poll_backoff_base': 5.0,
+    'poll_backoff_factor': 1.6,
+    'poll_max_delay': 60.0,
+    'poll_jitter': 0.2,
+    'poll_rate': 2.0,  # status requests per second across all jobs
+    'poll_batch_size': 10,
+    'poll_max_errors': 5,  # consecutive failed status requests before a RID is given up
+    # per-sequence result cache
+    'cache_enabled': True,
+    'cache_path': 'blast_cache.sqlite3',
+    'cache_max_bytes': 512 * 1024 * 1024,
+    'cache_ttl': 7 * 24 * 3600,  # seconds, so NCBI database updates get picked up
+    # worker processes that build the PDF reports
+    'report_workers': 2,
+    'eager_reports': False,  # False renders each PDF the first time it is downloaded or previewed
+    'report_rows_per_table': 40,  # full report hit tables are emitted in page sized pieces
+    'report_max_rows_per_query': None,  # rows past this go to BLAST_Full_Report_Appendix.pdf
+    # per-file work inside one report (CSV reads, anomaly classification), results merge in file order
+    'report_file_workers': 1,
+    'report_file_executor': 'process',  # 'thread' or 'process'
+    # durable job queue
+    'job_db_path': 'blast_jobs.sqlite3',
+    'job_workers': 4,
+    # progress pub/sub
+    'progress_replay': 50,  # messages kept per job for reconnecting clients
+    'progress_max_jobs': 500,
+    # per-query result summaries pushed to the browser as chunks are parsed
+    'live_results': True,
+    'live_top_hits': 10,
+    # CSV bundle download
+    'cache_csv_bundle': True,  # keep the zip in the job folder, repeat and ranged downloads reuse it
+    'zip_chunk_size': 64 * 1024,
+    # seconds between checks of the config file for edits
+    'config_check_interval': 2.0,
+    # organism enrichment, off by default as the perplexity backend needs an API key
+    'enrich_taxonomy': False,
+    'taxonomy_backend': 'perplexity',  # or 'stub' for offline runs
+    'taxonomy_cache_path': 'taxonomy_cache.sqlite3',
+    'taxonomy_cache_ttl': 90 * 24 * 3600,
+    'taxonomy_concurrency': 4,
+    'taxonomy_rate': 1.0,  # lookups per second
+    # local NCBI taxonomy, build the index with `python taxdump.py <dir with names.dmp and nodes.dmp>`
+    'taxdump_dir': 'taxdump',
+    'taxdump_index_dir': 'taxdump/index',
+    'anomaly_group_rank': None,  # e.g. 'family' groups anomalies by taxid lineage, None keeps title based species groups
 }
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+AGGREGATE_DIR = "aggregates"
+# Bumped whenever the shape of a stored aggregate changes, older sidecars then miss
+AGGREGATE_VERSION = 1
+
+
+def file_digest(path):
+    """sha256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def aggregate_key(csv_path, params=None):
+    """Sidecar key of one query CSV: its content plus whatever else the aggregate depends on"""
+    params = json.dumps([AGGREGATE_VERSION, params], sort_keys=True, default=str)
+    return f"{file_digest(csv_path)}-{hashlib.sha256(params.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _sidecar_path(folder_path, kind, stem):
+    return Path(folder_path) / AGGREGATE_DIR / f"{stem}.{kind}.json"
+
+
+def _json_value(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def load_aggregate(folder_path, kind, stem, key):
+    """The stored aggregate of one file, None when it is missing or was computed from other content"""
+    path = _sidecar_path(folder_path, kind, stem)
+    try:
+        with open(path, encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stored["data"] if stored.get("key") == key else None
+
+
+def save_aggregate(folder_path, kind, stem, key, data):
+    path = _sidecar_path(folder_path, kind, stem)
+    path.parent.mkdir(exist_ok=True)
+    # Per-process temp name, two report workers may store the same file at once
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "data": data}, f, default=_json_value)
+    tmp_path.replace(path)
+
+
+def prune_aggregates(folder_path, kind):
+    """Delete the sidecars of query CSVs that no longer exist"""
+    suffix = f".{kind}.json"
+    for path in (Path(folder_path) / AGGREGATE_DIR).glob(f"*{suffix}"):
+        if not (Path(folder_path) / f"{path.name[:-len(suffix)]}.csv").exists():
+            path.unlink(missing_ok=True)
+
+
+def cached_aggregates(folder_path, kind, stems, compute, params=None):
+    """{stem: aggregate} for the query CSVs of a job, computing only files without a matching sidecar.
+
+    compute(stems) returns {stem: aggregate} for the stems it is given.
+    """
+    folder = Path(folder_path)
+    prune_aggregates(folder, kind)
+    keys = {stem: aggregate_key(folder / f"{stem}.csv", params) for stem in stems}
+    aggregates = {stem: load_aggregate(folder, kind, stem, keys[stem]) for stem in stems}
+    missing = [stem for stem, data in aggregates.items() if data is None]
+    if missing:
+        computed = compute(missing)
+        for stem in missing:
+            save_aggregate(folder, kind, stem, keys[stem], computed[stem])
+            # Round trip through JSON so fresh and cached aggregates look the same
+            aggregates[stem] = json.loads(json.dumps(computed[stem], default=_json_value))
+    return aggregates
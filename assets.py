@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import json
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = Path("static")
+DIST_DIR = STATIC_DIR / "dist"
+TEMPLATE_DIR = Path("templates")
+MANIFEST_NAME = "manifest.json"
+
+# Preferred first, brotli only when the module is installed
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def compress(data):
+    """Return {content-encoding: bytes} for every encoding that is smaller than the original"""
+    encoded = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(data, quality=11)
+    return {name: body for name, body in encoded.items() if len(body) < len(data)}
+
+
+def build_assets(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Copy each static file to a content hashed name next to its precompressed variants.
+
+    Writes manifest.json mapping the source name to the fingerprinted one.
+    """
+    static_dir, dist_dir = Path(static_dir), Path(dist_dir)
+    dist_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    for source in sorted(static_dir.iterdir()):
+        if not source.is_file():
+            continue
+        data = source.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        name = f"{source.stem}.{digest}{source.suffix}"
+        target = dist_dir / name
+        if not target.exists():
+            target.write_bytes(data)
+            for encoding, body in compress(data).items():
+                target.with_name(name + dict(ENCODINGS)[encoding]).write_bytes(body)
+        manifest[source.name] = name
+    (dist_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def load_manifest(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Read the asset manifest, rebuilding it when a static file changed since the last build"""
+    manifest_path = Path(dist_dir) / MANIFEST_NAME
+    if manifest_path.exists():
+        built = manifest_path.stat().st_mtime
+        sources = [f for f in Path(static_dir).iterdir() if f.is_file()]
+        if all(f.stat().st_mtime <= built for f in sources):
+            return json.loads(manifest_path.read_text())
+    return build_assets(static_dir, dist_dir)
+
+
+def asset_variants(manifest, dist_dir=DIST_DIR):
+    """{fingerprinted name: {encoding: path}} with None standing for the uncompressed file"""
+    variants = {}
+    for name in manifest.values():
+        path = Path(dist_dir) / name
+        variants[name] = {None: path}
+        for encoding, suffix in ENCODINGS:
+            encoded = path.with_name(name + suffix)
+            if encoded.exists():
+                variants[name][encoding] = encoded
+    return variants
+
+
+class Page:
+    """A page rendered once, kept with its precompressed bodies and validator"""
+
+    def __init__(self, html):
+        self.body = html.encode("utf-8")
+        self.encoded = compress(self.body)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:32]}"'
+
+
+def render_index(manifest, template_dir=TEMPLATE_DIR, **context):
+    """Render the page once, context holds the template variables besides asset()"""
+    env = Environment(loader=FileSystemLoader(str(template_dir)), autoescape=True)
+
+    def asset(name):
+        return f"static/dist/{manifest[name]}"
+
+    return Page(env.get_template("index.html").render(asset=asset, **context))
+
+
+def accepted_encodings(accept_encoding):
+    """Encodings from an Accept-Encoding header that the client does not refuse"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    return accepted
+
+
+def negotiate(accept_encoding, available):
+    """Pick the best encoding both sides support, None for identity"""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding, _ in ENCODINGS:
+        if encoding in available and (encoding in accepted or "*" in accepted):
+            return encoding
+    return None
+
+
+if __name__ == "__main__":
+    for source, name in build_assets().items():
+        print(f"{source} -> {DIST_DIR / name}")
@@ -0,0 +1,102 @@
+"""How the per-file report stages scale with file count and worker count.
+
+    python benchmarks/report_scaling.py [--files 50 200 500] [--hits 300] [--workers 1 2 4 8]
+
+Builds synthetic jobs of query CSVs in a temp directory, then times the
+CSV read behind the Parquet store and the anomaly classification of every
+file, sequentially and on thread and process pools. Pools are warmed up
+before they are timed, as the server keeps them for its whole life. Each
+parallel run is checked against the sequential result.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pandas as pd
+
+from CONFIG import *
+from blast import FIELDNAMES
+from parallel import map_files
+from report import compile_keywords, process_file
+from store import read_hits_csv
+
+SPECIES = ["Sus scrofa", "Bos taurus", "Homo sapiens", "Gallus gallus", "Ovis aries", "Capra hircus", "Equus caballus"]
+
+
+def write_job(folder, files, hits):
+    rnd = random.Random(files)
+    for i in range(files):
+        rows = []
+        for h in range(hits):
+            species = rnd.choice(SPECIES)
+            rows.append([
+                f"Query_{i}", f"query {i}", f"gi|{h}", f"AB{h:06d}",
+                f"{species} isolate {rnd.randint(1, 999)} cytochrome b gene, partial cds",
+                9000 + SPECIES.index(species), species, round(rnd.uniform(80, 100), 2),
+                round(rnd.uniform(50, 500), 1), rnd.choice([0.0, 1e-50, 3e-20, 2e-5]),
+                1, round(rnd.uniform(50, 100), 2), round(rnd.uniform(50, 500), 1), 1e-50, round(rnd.uniform(80, 100), 2),
+            ])
+        pd.DataFrame(rows, columns=FIELDNAMES).to_csv(folder / f"query {i}.csv", index=False)
+
+
+def summary(all_data):
+    return [
+        (data['anomaly_count'], data['normal_count'],
+         [(group['species_group'], group['count']) for group in data['grouped_anomalies']],
+         [sample['subject_accession'] for sample in data['normal_samples']])
+        for data in all_data
+    ]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--hits", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    pattern = compile_keywords(["sus scrofa"])
+    print(f"{os.cpu_count()} cores, {args.hits} hits per file")
+    print(f"{'files':>6} {'executor':>8} {'workers':>7} {'read s':>8} {'classify s':>10} {'speedup':>8}")
+    for files in args.files:
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp)
+            write_job(folder, files, args.hits)
+            csv_files = sorted(folder.glob("*.csv"))
+            frames = map_files(read_hits_csv, csv_files, workers=1)
+            names = [csv_file.name for csv_file in csv_files]
+            patterns = [pattern] * files
+
+            baseline = None
+            for executor in ("thread", "process"):
+                for workers in args.workers:
+                    if workers == 1 and executor == "process":
+                        continue
+                    if workers > 1:
+                        # Pools live for the whole server, start the workers and their imports outside the timing
+                        map_files(process_file, names, frames, patterns, workers=workers, executor=executor)
+                    read_s, _ = timed(lambda: map_files(read_hits_csv, csv_files, workers=workers, executor=executor))
+                    classify_s, all_data = timed(lambda: map_files(process_file, names, frames, patterns, workers=workers, executor=executor))
+                    if baseline is None:
+                        baseline = (read_s + classify_s, summary(all_data))
+                    elif summary(all_data) != baseline[1]:
+                        raise SystemExit(f"{executor} x{workers} differs from the sequential result")
+                    label = "inline" if workers == 1 else executor
+                    speedup = baseline[0] / (read_s + classify_s)
+                    print(f"{files:>6} {label:>8} {workers:>7} {read_s:>8.2f} {classify_s:>10.2f} {speedup:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,164 +9,587 @@ import io
 import csv
 import zipfile
 import asyncio
+import tempfile
+import ijson
 from pathlib import Path
 
 from CONFIG import *
 from report import *
+from poller import PollScheduler
+from cache import cache_key, get_cache
+from store import write_result_store
+from render import ensure_report, render_reports, shutdown_report_pool
+from jobs import JobQueue, get_job_store
+from hub import hub
+from enrich import enrich_job
+from local_blast import LocalBlastBackend
+from prefilter import split_confident
+from results import result_frames
+from hsps import AGGREGATE_COLUMNS, HspTable, aggregate_hsps
 
-async def send_blast(fasta_string):
+_client = None
+
+def _http2_available():
+    try:
+        import h2
+    except ImportError:
+        return False
+    return True
+
+async def open_client(transport=None):
+    """Create the application wide NCBI client, pass a transport (e.g. httpx.MockTransport) for tests"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    limits = httpx.Limits(
+        max_connections=CONFIG['http_max_connections'],
+        max_keepalive_connections=CONFIG['http_max_keepalive_connections'],
+        keepalive_expiry=CONFIG['http_keepalive_expiry']
+    )
+    _client = httpx.AsyncClient(
+        limits=limits,
+        timeout=CONFIG['http_timeout'],
+        http2=transport is None and _http2_available(),
+        transport=transport,
+        headers={"User-Agent": "Mozilla/5.0"}
+    )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def get_client():
+    # Lifespan normally opens the client, this covers scripts running jobs directly
+    if _client is None:
+        await open_client()
+    return _client
+
+def make_results_folder():
     folder_name = ''.join(random.choices(string.ascii_letters + string.digits, k=10))
     folder_path = Path("blast_res") / folder_name
     folder_path.mkdir(parents=True, exist_ok=True)
-    async with httpx.AsyncClient() as client:
-        headers = {
-            "User-Agent": "Mozilla/5.0"
-        }
-        
-        put_params = {
-            "CMD": "Put",
-            "PROGRAM": load_config()[2],
-            "DATABASE": load_config()[3],
-            "QUERY": fasta_string,
-            "FORMAT_TYPE": "JSON2",
-            "HITLIST_SIZE": load_config()[1],
-            "DESCRIPTIONS": load_config()[1],
-            "ALIGNMENTS": load_config()[1],
-            "FILTER": load_config()[0]
-        }
-        
-        for i in range(10):
-            resp = await client.post(BASE_URL, data=put_params, headers=headers)
-            if resp.status_code == 200:
-                break
-        rid_match = re.search(r'name="RID"\s+[^>]*value="([A-Z0-9]+)"', resp.text)
-        rid = rid_match.group(1)
-        return rid, folder_path
+    return folder_path
+
+def read_fasta(fasta_string):
+    """Split a FASTA string into (title, sequence) records"""
+    records = []
+    for block in fasta_string.split(">"):
+        if not block.strip():
+            continue
+        lines = block.strip().splitlines()
+        records.append((lines[0].strip(), "".join(line.strip() for line in lines[1:])))
+    return records
+
+def split_fasta(fasta_string, max_sequences=None, max_bytes=None):
+    """Break a FASTA string into chunks bounded by sequence count and query size"""
+    max_sequences = max_sequences or CONFIG['chunk_max_sequences']
+    max_bytes = max_bytes or CONFIG['chunk_max_bytes']
+    if not fasta_string.lstrip().startswith(">"):
+        # Bare sequence without a header, nothing to split on
+        return [fasta_string]
+
+    chunks = []
+    current = []
+    current_size = 0
+    for title, sequence in read_fasta(fasta_string):
+        entry = f">{title}\n{sequence}"
+        if current and (len(current) >= max_sequences or current_size + len(entry) > max_bytes):
+            chunks.append("\n".join(current))
+            current = []
+            current_size = 0
+        current.append(entry)
+        current_size += len(entry) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+async def send_blast(fasta_string, settings=None):
+    client = await get_client()
+    settings = settings or get_settings()
+
+    put_params = {
+        "CMD": "Put",
+        "PROGRAM": settings.program,
+        "DATABASE": settings.database,
+        "QUERY": fasta_string,
+        "FORMAT_TYPE": "JSON2",
+        "HITLIST_SIZE": settings.hitlist_size,
+        "DESCRIPTIONS": settings.hitlist_size,
+        "ALIGNMENTS": settings.hitlist_size,
+        "FILTER": settings.filter
+    }
+    
+    for i in range(10):
+        resp = await client.post(BASE_URL, data=put_params)
+        if resp.status_code == 200:
+            break
+    rid_match = re.search(r'name="RID"\s+[^>]*value="([A-Z0-9]+)"', resp.text)
+    if rid_match is None:
+        raise ValueError(f"NCBI did not return a RID (HTTP {resp.status_code})")
+    # RTOE is NCBI's estimate in seconds of when the search will be done
+    rtoe_match = re.search(r'RTOE\s*=\s*(\d+)', resp.text)
+    rtoe = int(rtoe_match.group(1)) if rtoe_match else None
+    return rid_match.group(1), rtoe
 
 async def check_blast(rid):
-    async with httpx.AsyncClient() as client:
-        poll = await client.get(
-            "https://blast.ncbi.nlm.nih.gov/Blast.cgi",
-            params={"CMD": "Get", "RID": rid, "FORMAT_TYPE": "JSON2"},
-        )
-        text = poll.text
-        if "Status=WAITING" in text:
-            return 0, None
-        if "Status=FAILED" in text:
-            with open("error.log", 'w+') as f:
-                f.write(text)
-            return 9, None
-        if "An error has occurred on the server" in text:
-            with open("error.log", 'w+') as f:
-                f.write(text)
-            return 9, None
-        if "Status=UNKNOWN" in text:
-            with open("error.log", 'w+') as f:
-                f.write(text)
-            return 9, None
-        else:  # Add this check
-            return 1, poll.content
+    """Status of a RID from its SearchInfo block, 0 waiting, 1 ready, 9 failed"""
+    client = await get_client()
+    poll = await client.get(
+        BASE_URL,
+        params={"CMD": "Get", "RID": rid, "FORMAT_OBJECT": "SearchInfo"},
+    )
+    text = poll.text
+    if poll.status_code != 200:
+        # Throttling pages and server hiccups carry no status, ask again later
+        return 0
+    if "Status=WAITING" in text:
+        return 0
+    if "Status=FAILED" in text:
+        with open("error.log", 'w+') as f:
+            f.write(text)
+        return 9
+    if "An error has occurred on the server" in text:
+        with open("error.log", 'w+') as f:
+            f.write(text)
+        return 9
+    if "Status=UNKNOWN" in text:
+        with open("error.log", 'w+') as f:
+            f.write(text)
+        return 9
+    if "Status=READY" in text:
+        return 1
+    return 0
+
+async def download_blast(rid):
+    """Stream the JSON2 archive of a finished RID to a temp file and return its path"""
+    client = await get_client()
+    # Stream the archive to disk instead of holding it in memory
+    with tempfile.NamedTemporaryFile(prefix=f"{rid}_", suffix=".zip", delete=False) as f:
+        try:
+            async with client.stream(
+                "GET",
+                BASE_URL,
+                params={"CMD": "Get", "RID": rid, "FORMAT_TYPE": "JSON2"},
+            ) as result:
+                async for block in result.aiter_bytes():
+                    f.write(block)
+        except BaseException:
+            # A timeout or reset mid download must not leave the partial archive behind
+            f.close()
+            Path(f.name).unlink(missing_ok=True)
+            raise
+    return Path(f.name)
+
+scheduler = PollScheduler(check_blast)
+
+
+class NcbiBackend:
+    """Submits to the NCBI URL API and waits on the shared poll scheduler"""
+
+    name = "ncbi"
+    label = "BLAST NCBI"
+
+    async def submit(self, fasta_string, settings):
+        return await send_blast(fasta_string, settings)
+
+    async def wait(self, rid, rtoe=None):
+        code = await scheduler.wait(rid, rtoe)
+        if code != 1:
+            return code, None
+        # Downloaded by this job, the scheduler goes on polling the other RIDs meanwhile
+        return code, await download_blast(rid)
+
+    async def stop(self):
+        await scheduler.stop()
+
+
+# submit(fasta, settings) -> (rid, rtoe) and wait(rid, rtoe) -> (code, path of a JSON2 zip or JSON file)
+BACKENDS = {
+    "ncbi": NcbiBackend,
+    "local": LocalBlastBackend,
+}
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[CONFIG['blast_backend']]()
+    return _backend
+
+# identity_pct, bit_score and evalue are the best HSP's, the aggregates cover every HSP of the hit
+FIELDNAMES = [
+    "query_id", "query_title", "subject_id", "subject_accession",
+    "subject_title", "taxid", "sci_name", "identity_pct",
+    "bit_score", "evalue"
+] + AGGREGATE_COLUMNS
+
+def safe_filename(query_title, fallback=""):
+    """Create a safe filename from query_title"""
+    if not query_title:
+        # Fallback to original name if query_title is empty
+        return fallback
+    # Remove or replace characters that are not safe for filenames
+    # Limit filename length to avoid filesystem issues
+    return re.sub(r'[<>:"/\\|?*]', '_', query_title)[:100]
+
+SEARCH_PREFIX = "BlastOutput2.report.results.search"
+
+def read_search_header(f):
+    """Read the query fields that come before the hits array, None if this is not a search report"""
+    header = None
+    for prefix, event, value in ijson.parse(f):
+        if prefix == SEARCH_PREFIX and event == "start_map":
+            header = {}
+        elif header is not None and prefix in (SEARCH_PREFIX + ".query_id", SEARCH_PREFIX + ".query_title", SEARCH_PREFIX + ".query_len"):
+            header[prefix.rsplit(".", 1)[1]] = value
+        elif prefix in (SEARCH_PREFIX + ".hits", SEARCH_PREFIX) and event in ("start_array", "end_map"):
+            break
+    return header
+
+# Hits per batch written to the query CSV, each batch's HSP aggregates are computed in one go
+HIT_BATCH = 256
+
+def write_hit_rows(writer, rows, arrays, query_len):
+    """Write a batch of hit rows followed by their HSP aggregates, arrays["hit"] counts from the batch's first row"""
+    aggregates = aggregate_hsps(arrays, len(rows), query_len)
+    # NaN (e.g. no query length for the coverage) is written as an empty cell like any missing value
+    columns = [["" if value != value else value for value in aggregates[name].tolist()] for name in AGGREGATE_COLUMNS]
+    writer.writerows(row + list(extra) for row, *extra in zip(rows, *columns))
+
+def write_hits_csv(csv_path, search, hits):
+    """Write the hits of one search report as a query CSV and keep all their HSPs in hsps/<stem>.npz
+
+    Rows go to disk batch by batch while the hits are parsed.
+    """
+    query_id = search.get("query_id", "")
+    query_title = search.get("query_title", "")
+    query_len = search.get("query_len")
+    table = HspTable()
+    rows = []
+    written = 0
+    with csv_path.open("w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(FIELDNAMES)
+        batch_hsps = 0
+        for hit in hits:
+            if not hit.get("description") or not hit.get("hsps"):
+                continue
+            desc = hit["description"][0]
+            hsps = hit["hsps"][0]
+            table.add_hit(written + len(rows), hit["hsps"])
+            rows.append([
+                query_id,
+                query_title,
+                desc.get("id", ""),
+                desc.get("accession", ""),
+                desc.get("title", ""),
+                desc.get("taxid", ""),
+                desc.get("sciname", ""),
+                round(100 * hsps.get("identity", 0) / max(hsps.get("align_len", 1), 1), 2),
+                hsps.get("bit_score", ""),
+                hsps.get("evalue", "")
+            ])
+            if len(rows) == HIT_BATCH:
+                write_hit_rows(writer, rows, table.arrays(batch_hsps, first_hit=written), query_len)
+                written += len(rows)
+                batch_hsps = len(table.hit)
+                rows = []
+        if rows or not written:
+            write_hit_rows(writer, rows, table.arrays(batch_hsps, first_hit=written), query_len)
+    table.save(csv_path.parent, csv_path.stem)
+
+def iter_json_reports(path):
+    """Yield the search of every report in a BLAST+ -outfmt 15 document, one query at a time
+
+    BlastOutput2 is a list there, a single report object is accepted as well.
+    """
+    with open(path, "rb") as f:
+        kind = next((event for prefix, event, _ in ijson.parse(f) if prefix == "BlastOutput2"), None)
+    prefix = "BlastOutput2.item" if kind == "start_array" else "BlastOutput2"
+    with open(path, "rb") as f:
+        for report in ijson.items(f, prefix, use_float=True):
+            search = report.get("report", {}).get("results", {}).get("search")
+            if search is not None:
+                yield search
 
 def parse_blast(content, folderid):
+    """Write one CSV per query in the results, returns {query_title: csv_path}
+
+    content is the path of an NCBI JSON2 archive or of a BLAST+ JSON
+    document (raw archive bytes also work). Archive members are parsed
+    incrementally so hits go to disk as they are read.
+    """
     folder_path = Path(folderid)
     folder_path.mkdir(parents=True, exist_ok=True)
-    with zipfile.ZipFile(io.BytesIO(content)) as zf:
+    if isinstance(content, (bytes, bytearray)):
+        content = io.BytesIO(content)
+    written = {}
+    if not zipfile.is_zipfile(content):
+        for index, search in enumerate(iter_json_reports(content)):
+            query_title = search.get("query_title", "")
+            csv_path = folder_path / f"{safe_filename(query_title, f'query_{index + 1}')}.csv"
+            write_hits_csv(csv_path, search, search.get("hits", []))
+            written[query_title] = csv_path
+        return written
+    with zipfile.ZipFile(content) as zf:
         for name in zf.namelist():
             if not name.lower().endswith(".json"):
                 continue
     
+            # The BlastJSON index member has no search report and is skipped here
             with zf.open(name) as f:
-                j = json.load(f)
-
-            if "BlastJSON" in j:
+                search = read_search_header(f)
+            if search is None:
                 continue
-
-            try:
-                report = j["BlastOutput2"]["report"]
-                search = report["results"]["search"]
-                query_title = search.get("query_title", "")
-                
-                # Create a safe filename from query_title
-                if query_title:
-                    # Remove or replace characters that are not safe for filenames
-                    safe_filename = re.sub(r'[<>:"/\\|?*]', '_', query_title)
-                    # Limit filename length to avoid filesystem issues
-                    safe_filename = safe_filename[:100]
-                else:
-                    # Fallback to original name if query_title is empty
-                    safe_filename = name.replace(".json", "")
-            except (KeyError, TypeError):
-                continue
-    
-            rows = []
-            for hit in search.get("hits", []):
-                if not hit.get("description") or not hit.get("hsps"):
-                    continue
-                desc = hit["description"][0]
-                hsps = hit["hsps"][0]
-                rows.append({
-                    "query_id": search.get("query_id", ""),
-                    "query_title": search.get("query_title", ""),
-                    "subject_id": desc.get("id", ""),
-                    "subject_accession": desc.get("accession", ""),
-                    "subject_title": desc.get("title", ""),
-                    "taxid": desc.get("taxid", ""),
-                    "sci_name": desc.get("sciname", ""),
-                    "identity_pct": round(100 * hsps.get("identity", 0) / max(hsps.get("align_len", 1), 1), 2),
-                    "bit_score": hsps.get("bit_score", ""),
-                    "evalue": hsps.get("evalue", "")
-                })
+            query_title = search.get("query_title", "")
     
-            csv_path = folder_path / f"{safe_filename}.csv"
-            with csv_path.open("w", newline="", encoding="utf-8") as csvfile:
-                fieldnames = [
-                    "query_id", "query_title", "subject_id", "subject_accession",
-                    "subject_title", "taxid", "sci_name", "identity_pct",
-                    "bit_score", "evalue"
-                ]
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                if rows:
-                    writer.writerows(rows)
+            csv_path = folder_path / f"{safe_filename(query_title, name.replace('.json', ''))}.csv"
+            with zf.open(name) as f:
+                write_hits_csv(csv_path, search, ijson.items(f, SEARCH_PREFIX + ".hits.item", use_float=True))
+            written[query_title] = csv_path
+    return written
+
+def restore_cached_hits(folder_path, title, cached):
+    """Write a cached query CSV into the results folder under the title it was submitted with
+
+    The cache keeps the CSV only, a restored query has its HSP aggregate
+    columns but no hsps/<stem>.npz next to it.
+    """
+    cached_title, data = cached
+    csv_path = Path(folder_path) / f"{safe_filename(title, 'query')}.csv"
+    if cached_title == title:
+        csv_path.write_bytes(data)
+        return csv_path
+    # Same sequence submitted under another name, relabel the query_title column
+    reader = csv.DictReader(io.StringIO(data.decode("utf-8")))
+    with csv_path.open("w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for row in reader:
+            row["query_title"] = title
+            writer.writerow(row)
+    return csv_path
+
+def cache_parsed_hits(chunk, written, settings):
+    cache = get_cache()
+    sequences = dict(read_fasta(chunk))
+    for query_title, csv_path in written.items():
+        if query_title in sequences:
+            cache.put(cache_key(sequences[query_title], settings, get_backend().name), query_title, csv_path)
 
 def write_fasta(fasta_string, folder_path):
     folder = Path(folder_path)
     folder.mkdir(parents=True, exist_ok=True)
     (folder / "inputs.fasta").write_text(fasta_string)
 
-async def run_blast_job(data, websocket):
-    content_ = ""
+async def notify(job_id, message, final=False):
+    """Publish a progress message for every client following the job"""
+    hub.publish(job_id, message, final)
+
+async def notify_results(job_id, csv_paths, settings):
+    """Push the summaries of freshly written query CSVs, the browser shows them before any report exists"""
+    csv_paths = list(csv_paths)
+    if not csv_paths or not CONFIG['live_results']:
+        return
+    frames = await asyncio.to_thread(result_frames, csv_paths, settings)
+    await notify(job_id, ["results", frames])
+
+async def job_events(job_id):
+    """Progress messages of a job for a newly connected client
+
+    Jobs this process runs or has queued replay their buffer and then stream live.
+    Older jobs only report the final state recorded in the job store.
+    """
+    job = get_job_store().get_job(job_id)
+    if hub.knows(job_id) or (job is not None and job["state"] in ("queued", "running")):
+        async for message in hub.subscribe(job_id):
+            yield message
+    elif job is None:
+        yield ["Error", f"Unknown BatchBLAST ID {job_id}."]
+    else:
+        yield ["folderid", job_id]
+        if job["state"] == "done":
+            yield ["Successfully completed mass BLAST", job["message"]]
+        else:
+            yield ["Error", "An error occurred, please check error.log file."]
+
+async def run_blast_chunk(chunk, total, folder_path, limiter, settings):
+    """Submit, poll and parse one chunk, resubmitting it alone if NCBI fails it
+
+    A chunk that already has a RID from before a restart is polled instead of resubmitted.
+    """
+    store = get_job_store()
+    backend = get_backend()
+    job_id = folder_path.as_posix()
+    index = chunk["idx"]
+    label = f"Chunk {index + 1}/{total}"
+    rid, rtoe = chunk["rid"], chunk["rtoe"]
+    for attempt in range(CONFIG['chunk_retries'] + 1):
+        content = None
+        try:
+            async with limiter:
+                if rid is None:
+                    rid, rtoe = await backend.submit(chunk["query"], settings)
+                    store.set_chunk(job_id, index, "submitted", rid, rtoe)
+                await notify(job_id, ["Waiting for BLAST Result...", f"{label} {backend.label} Request ID: {rid}", f"BatchBLAST ID: {job_id}", " This may take up 5 minutes"])
+                code, content = await backend.wait(rid, rtoe)
+            if code == 1:
+                # ijson parsing and the CSV/npz writes would stall every other chunk and client
+                written = await asyncio.to_thread(parse_blast, content, folder_path)
+                if CONFIG['cache_enabled']:
+                    cache_parsed_hits(chunk["query"], written, settings)
+                await notify_results(job_id, written.values(), settings)
+                store.set_chunk(job_id, index, "done", rid, rtoe)
+                await notify(job_id, ["BLAST Result received...", f"{label} parsed into the results folder."])
+                return True
+        except Exception as e:
+            with open("error.log", 'w+') as f:
+                f.write(f"{label}: {e}")
+                f.write(str(content))
+        finally:
+            if isinstance(content, Path):
+                content.unlink(missing_ok=True)
+        rid, rtoe = None, None
+        if attempt < CONFIG['chunk_retries']:
+            await notify(job_id, ["Retrying BLAST...", f"{label} failed, resubmitting it (attempt {attempt + 2})."])
+    store.set_chunk(job_id, index, "failed")
+    return False
+
+def restore_cached_sequences(data, folder_path, settings):
+    """Write cached hits into the folder, return the FASTA of sequences still to search and the restored CSVs"""
+    if not CONFIG['cache_enabled'] or not data.lstrip().startswith(">"):
+        return data, []
+    # Sequences already searched with the same parameters skip NCBI entirely
+    cache = get_cache()
+    misses = []
+    restored = []
+    for title, sequence in read_fasta(data):
+        cached = cache.get(cache_key(sequence, settings, get_backend().name))
+        if cached is None:
+            misses.append(f">{title}\n{sequence}")
+        else:
+            restored.append(restore_cached_hits(folder_path, title, cached))
+    return "\n".join(misses), restored
+
+# subject_id of the row written for a sequence the k-mer prefilter answered instead of BLAST
+PREFILTER_SUBJECT = "kmer-prefilter"
+
+def write_prefilter_hit(folder_path, title, score, settings):
+    """Query CSV for a sequence the k-mer prefilter matched to the reference, it is not searched
+
+    The single row is labelled as a prefilter match in every column a report
+    shows and has no scores, it must not read as a BLAST hit.
+    """
+    csv_path = Path(folder_path) / f"{safe_filename(title, 'query')}.csv"
+    with csv_path.open("w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerow({
+            "query_id": "",
+            "query_title": title,
+            "subject_id": PREFILTER_SUBJECT,
+            "subject_accession": "not searched",
+            "subject_title": f"Not a BLAST hit: k-mer prefilter matched the {settings.non_anomaly_keyword} reference ({score:.1%} containment)",
+            "taxid": "",
+            "sci_name": settings.non_anomaly_keyword,
+            "identity_pct": "",
+            "bit_score": "",
+            "evalue": ""
+        })
+    return csv_path
+
+def prefilter_sequences(data, folder_path, settings):
+    """Answer sequences that clearly match the reference FASTA locally, return the FASTA still to search and their CSVs"""
+    if not CONFIG['prefilter_reference'] or not data.lstrip().startswith(">"):
+        return data, []
+    matched, ambiguous = split_confident(read_fasta(data))
+    written = [write_prefilter_hit(folder_path, title, score, settings) for title, score in matched]
+    return "\n".join(f">{title}\n{sequence}" for title, sequence in ambiguous), written
+
+async def submit_blast_job(data):
+    """Record a new job and queue it, it starts once a job worker is free"""
+    folder_path = make_results_folder()
+    write_fasta(data, folder_path)
+    job_id = folder_path.as_posix()
+    get_job_store().create_job(job_id)
+    await notify(job_id, ["folderid", job_id])
+    await notify(job_id, ["Running BLAST NCBI...", "Your BLAST job is queued."])
+    await job_queue.put(job_id)
+    return job_id
+
+async def resume_blast_jobs():
+    """Queue again every job a previous server process left unfinished"""
+    for job_id in get_job_store().unfinished_jobs():
+        await notify(job_id, ["folderid", job_id])
+        await job_queue.put(job_id)
+
+async def run_blast_job(job_id):
+    store = get_job_store()
+    folder_path = Path(job_id)
     try:
-        await websocket.send_text(json.dumps(["Running BLAST NCBI...", "Server is running mass BLAST operation."]))
-        rid, folder_path = await send_blast(data)
-        write_fasta(data, folder_path)
-        folder_display = folder_path.as_posix()
-        await websocket.send_text(json.dumps(["folderid", folder_display]))
-        await websocket.send_text(json.dumps(["Waiting for BLAST Result...", f"BLAST NCBI Request ID: {rid}", f"BatchBLAST ID: {folder_display}", " This may take up 5 minutes"]))
-        
-        while True:
-            code, content = await check_blast(rid)
-            if code == 0:
-                await asyncio.sleep(4)
-                continue
-            elif code == 9:
-                await websocket.send_text(json.dumps(["Error", "An error occurred, please check error.log file."]))
-                return
-            elif code == 1:
-                content_ = content
-                break
+        await notify(job_id, ["Running BLAST NCBI...", "Server is running mass BLAST operation."])
+        store.set_job_state(job_id, "running")
+        data = (folder_path / "inputs.fasta").read_text()
+        # One settings snapshot for every chunk, an edit to the config file mid job does not mix searches
+        settings = get_settings()
+
+        chunks = store.get_chunks(job_id)
+        if not chunks:
+            pending, restored = restore_cached_sequences(data, folder_path, settings)
+            if restored:
+                await notify(job_id, ["Running BLAST NCBI...", f"{len(restored)} sequences found in the result cache."])
+            # Building the k-mer index after the reference changed takes a while, keep it off the event loop
+            pending, matched = await asyncio.to_thread(prefilter_sequences, pending, folder_path, settings)
+            if matched:
+                await notify(job_id, ["Running BLAST NCBI...", f"{len(matched)} sequences matched the reference and skip BLAST."])
+            await notify_results(job_id, restored + matched, settings)
+            store.add_chunks(job_id, split_fasta(pending) if pending else [])
+            chunks = store.get_chunks(job_id)
+
+        limiter = asyncio.Semaphore(CONFIG['max_parallel_rids'])
+        results = await asyncio.gather(*[
+            run_blast_chunk(chunk, len(chunks), folder_path, limiter, settings)
+            for chunk in chunks if chunk["state"] != "done"
+        ])
+        failed = results.count(False)
+        if chunks and failed == len(chunks) and not any(folder_path.glob("*.csv")):
+            store.set_job_state(job_id, "failed", "every chunk failed")
+            await notify(job_id, ["Error", "An error occurred, please check error.log file."], final=True)
+            return
         
-        await websocket.send_text(json.dumps(["BLAST Completed...", "Processing result."]))
-        parse_blast(content_, folder_path)
-        await websocket.send_text(json.dumps(["Parsing Completed...", "BLAST Result successfully parsed, making reports."]))
-        generate_report(folder_path)
-        generate_blast_full_report(folder_path)
-        await websocket.send_text(json.dumps(["Successfully completed mass BLAST", "Mass BLAST is completed successfully and you can download the reports."]))
+        if not any(folder_path.glob("*.csv")):
+            # Nothing came back, there is no store to build and no report to render
+            message = "Mass BLAST finished without any results, there are no reports to download."
+            if failed:
+                message = f"Mass BLAST finished with {failed} of {len(chunks)} chunks failed and no results, see error.log."
+            store.set_job_state(job_id, "done", message)
+            await notify(job_id, ["Successfully completed mass BLAST", message], final=True)
+            return
+        # Building the store reads every CSV, keep it off the event loop
+        await asyncio.to_thread(write_result_store, folder_path)
+        await notify(job_id, ["Parsing Completed...", "BLAST Result successfully parsed."])
+        if CONFIG['enrich_taxonomy']:
+            records = await enrich_job(folder_path)
+            await notify(job_id, ["Enriching taxonomy...", f"{len(records)} organisms resolved."])
+        if CONFIG['eager_reports']:
+            async for report_name in render_reports(folder_path):
+                await notify(job_id, ["Building reports...", f"{report_name} is ready."])
+        message = "Mass BLAST is completed successfully and you can download the reports."
+        if failed:
+            message = f"Mass BLAST finished with {failed} of {len(chunks)} chunks failed, see error.log. You can download the reports."
+        store.set_job_state(job_id, "done", message)
+        await notify(job_id, ["Successfully completed mass BLAST", message], final=True)
     except Exception as e:
         with open("error.log", 'w+') as f:
                 f.write(str(e))
-                f.write(str(content_))
-        await websocket.send_text(json.dumps(["Error", f"An error occurred, please check error.log file."]))
+        store.set_job_state(job_id, "failed", str(e))
+        await notify(job_id, ["Error", f"An error occurred, please check error.log file."], final=True)
+
+job_queue = JobQueue(run_blast_job)
 
 
 # ---- FIXES BELOW ----
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import zipfile
+from pathlib import Path
+
+from CONFIG import *
+
+BUNDLE_NAME = "csv_bundle.zip"
+ETAG_NAME = "csv_bundle.etag"
+
+
+def bundle_etag(csv_paths):
+    """Strong validator for the CSV bundle, changes whenever a CSV is added or rewritten"""
+    digest = hashlib.sha256()
+    for path in csv_paths:
+        stat = path.stat()
+        digest.update(f"{path.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def cached_bundle(folder_path, etag):
+    """Return the cached bundle if it was built from the current CSVs, else None"""
+    folder = Path(folder_path)
+    bundle_path = folder / BUNDLE_NAME
+    etag_path = folder / ETAG_NAME
+    if bundle_path.exists() and etag_path.exists() and etag_path.read_text() == etag:
+        return bundle_path
+    return None
+
+
+class _ZipSink:
+    """Write-only, unseekable file object that collects the archive bytes as zipfile emits them"""
+
+    def __init__(self, copy_to=None):
+        self.buffer = bytearray()
+        self.copy_to = copy_to
+
+    def write(self, data):
+        self.buffer += data
+        if self.copy_to is not None:
+            self.copy_to.write(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def iter_bundle(folder_path, csv_paths, etag=None):
+    """Yield the zipped CSVs piece by piece, compressing one file at a time.
+
+    A sync generator, so StreamingResponse runs the compression in a worker
+    thread. With an etag the archive is also written to the job folder and
+    becomes the cached bundle once the last byte went out.
+    """
+    folder = Path(folder_path)
+    chunk_size = CONFIG['zip_chunk_size']
+    tmp_path = folder / f"{BUNDLE_NAME}.{os.getpid()}.{id(csv_paths)}.tmp"
+    copy_to = tmp_path.open("wb") if etag is not None else None
+    finished = False
+    try:
+        sink = _ZipSink(copy_to)
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for path in csv_paths:
+                info = zipfile.ZipInfo.from_file(path, arcname=path.name)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with path.open("rb") as src, zipf.open(info, "w") as dst:
+                    while block := src.read(chunk_size):
+                        dst.write(block)
+                        if len(sink.buffer) >= chunk_size:
+                            yield sink.take()
+                if sink.buffer:
+                    yield sink.take()
+        # Central directory
+        yield sink.take()
+        finished = True
+    finally:
+        if copy_to is not None:
+            copy_to.close()
+            if finished:
+                tmp_path.replace(folder / BUNDLE_NAME)
+                (folder / ETAG_NAME).write_text(etag)
+            else:
+                # Client went away mid download
+                tmp_path.unlink(missing_ok=True)
+
+
+def build_bundle(folder_path, csv_paths, etag):
+    """Write the cached bundle in one go, for requests that need a seekable file"""
+    for _ in iter_bundle(folder_path, csv_paths, etag):
+        pass
+    return Path(folder_path) / BUNDLE_NAME
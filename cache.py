@@ -0,0 +1,85 @@
+import hashlib
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+
+from CONFIG import *
+
+
+def cache_key(sequence, settings, backend="ncbi"):
+    """Hash a normalized query sequence together with the search parameters that shape its hits"""
+    normalized = "".join(sequence.split()).upper()
+    params = [settings.filter, str(settings.hitlist_size), settings.program, settings.database]
+    # NCBI keys predate the backend choice and stay as they were
+    if backend != "ncbi":
+        params.append(backend)
+    return hashlib.sha256("\x1f".join([normalized] + params).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Persistent store of parsed per-query CSVs with LRU size eviction and a TTL"""
+
+    def __init__(self, path=None, max_bytes=None, ttl=None):
+        self.path = path or CONFIG['cache_path']
+        self.max_bytes = max_bytes if max_bytes is not None else CONFIG['cache_max_bytes']
+        self.ttl = ttl if ttl is not None else CONFIG['cache_ttl']
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hits ("
+            "key TEXT PRIMARY KEY, query_title TEXT, data BLOB, size INTEGER, "
+            "created REAL, accessed REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS hits_accessed ON hits (accessed)")
+        self.conn.commit()
+
+    def get(self, key):
+        """Return (query_title, csv_bytes) for a fresh entry, or None"""
+        row = self.conn.execute(
+            "SELECT query_title, data, created FROM hits WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[2] > self.ttl:
+            self.conn.execute("DELETE FROM hits WHERE key = ?", (key,))
+            self.conn.commit()
+            return None
+        self.conn.execute("UPDATE hits SET accessed = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+        return row[0], zlib.decompress(row[1])
+
+    def put(self, key, query_title, csv_path):
+        data = zlib.compress(Path(csv_path).read_bytes())
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO hits VALUES (?, ?, ?, ?, ?, ?)",
+            (key, query_title, data, len(data), now, now)
+        )
+        self.evict()
+        self.conn.commit()
+
+    def evict(self):
+        self.conn.execute("DELETE FROM hits WHERE created < ?", (time.time() - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM hits").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the cache fits again
+        for key, size in self.conn.execute("SELECT key, size FROM hits ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM hits WHERE key = ?", (key,))
+            total -= size
+
+    def close(self):
+        self.conn.close()
+
+
+_cache = None
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
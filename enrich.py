@@ -0,0 +1,184 @@
+import asyncio
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from CONFIG import *
+from ratelimit import RateLimiter
+from store import load_results
+
+TAXONOMY_NAME = "taxonomy.json"
+FIELDS = ["species_name", "english_name", "family", "environment", "common_name", "type", "general_group"]
+
+
+def unknown_record(sci_name):
+    record = {field: "Unknown" for field in FIELDS}
+    record["species_name"] = sci_name
+    return record
+
+
+def taxon_key(taxid, sci_name):
+    """Cache key of a hit's organism, the taxid when NCBI gave one and the name otherwise"""
+    if pd.notna(taxid):
+        return f"taxid:{int(taxid)}"
+    return f"name:{sci_name.strip().lower()}"
+
+
+class TaxonomyCache:
+    """Persistent taxon key -> taxonomy record store, entries expire after a TTL"""
+
+    def __init__(self, path=None, ttl=None):
+        self.path = path or CONFIG['taxonomy_cache_path']
+        self.ttl = ttl if ttl is not None else CONFIG['taxonomy_cache_ttl']
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS taxa (key TEXT PRIMARY KEY, data TEXT, created REAL)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """Return {key: record} for the keys that have a fresh entry"""
+        cutoff = time.time() - self.ttl
+        found = {}
+        keys = list(keys)
+        # Stay below SQLite's bound parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, data FROM taxa WHERE created >= ? AND key IN ({','.join('?' * len(batch))})",
+                [cutoff] + batch
+            ).fetchall()
+            found.update((key, json.loads(data)) for key, data in rows)
+        return found
+
+    def put_many(self, records):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO taxa VALUES (?, ?, ?)",
+            [(key, json.dumps(record), now) for key, record in records.items()]
+        )
+        self.conn.execute("DELETE FROM taxa WHERE created < ?", (now - self.ttl,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class PerplexityBackend:
+    """Looks a species up with search.search, the blocking call runs in a thread"""
+
+    async def lookup(self, sci_name):
+        from search import search
+        content = await asyncio.to_thread(search, sci_name)
+        entities = json.loads(content).get("entity") or []
+        if not entities:
+            return unknown_record(sci_name)
+        return {field: entities[0].get(field, "Unknown") for field in FIELDS}
+
+
+class StubBackend:
+    """Offline backend answering from a fixed {sci_name: record} table, Unknown for the rest"""
+
+    def __init__(self, records=None):
+        self.records = records or {}
+        self.calls = 0
+
+    async def lookup(self, sci_name):
+        self.calls += 1
+        record = unknown_record(sci_name)
+        record.update(self.records.get(sci_name, {}))
+        return record
+
+
+BACKENDS = {
+    "perplexity": PerplexityBackend,
+    "stub": StubBackend,
+}
+
+
+def unique_taxa(frames):
+    """Distinct (key, sci_name) pairs over every hit frame of a job"""
+    columns = [df[["taxid", "sci_name"]] for df in frames if len(df)]
+    if not columns:
+        return {}
+    combined = pd.concat(columns, ignore_index=True).drop_duplicates()
+    combined = combined[combined["sci_name"].astype(str).str.strip() != ""]
+    return {taxon_key(taxid, str(name)): str(name) for taxid, name in zip(combined["taxid"], combined["sci_name"])}
+
+
+async def enrich_taxa(taxa, backend=None, cache=None):
+    """Resolve {key: sci_name} to {key: record}, each key at most once across all jobs"""
+    backend = backend or get_taxonomy_backend()
+    cache = cache or get_taxonomy_cache()
+    resolved = cache.get_many(taxa)
+    missing = {key: name for key, name in taxa.items() if key not in resolved}
+    if not missing:
+        return resolved
+
+    limiter, semaphore = get_taxonomy_limits()
+
+    async def lookup(key, name):
+        async with semaphore:
+            await limiter.wait()
+            try:
+                return key, await backend.lookup(name)
+            except Exception as e:
+                print(f"Taxonomy lookup failed for {name}: {e}")
+                return key, None
+
+    looked_up = dict(await asyncio.gather(*[lookup(key, name) for key, name in missing.items()]))
+    # Failed lookups are not cached so the next job tries them again
+    found = {key: record for key, record in looked_up.items() if record is not None}
+    cache.put_many(found)
+    resolved.update(found)
+    resolved.update((key, unknown_record(missing[key])) for key, record in looked_up.items() if record is None)
+    return resolved
+
+
+async def enrich_job(folder_path, backend=None, cache=None):
+    """Enrich every organism of a job and write the records to taxonomy.json in its folder"""
+    folder = Path(folder_path)
+    frames = await asyncio.to_thread(lambda: list(load_results(folder).values()))
+    records = await enrich_taxa(unique_taxa(frames), backend, cache)
+    (folder / TAXONOMY_NAME).write_text(json.dumps(records, indent=1))
+    return records
+
+
+def load_taxonomy(folder_path):
+    """The job's taxonomy.json as {taxon key: record}, empty when the job was not enriched"""
+    path = Path(folder_path) / TAXONOMY_NAME
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def hit_taxonomy(taxonomy, row):
+    """Record of the organism of a hit row (a dict as read from the CSV), None when it was not resolved"""
+    taxid = row.get("taxid")
+    return taxonomy.get(taxon_key(None if taxid == "" else taxid, str(row.get("sci_name", ""))))
+
+
+_backend = None
+_cache = None
+_limits = None
+
+def get_taxonomy_backend():
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[CONFIG['taxonomy_backend']]()
+    return _backend
+
+def get_taxonomy_cache():
+    global _cache
+    if _cache is None:
+        _cache = TaxonomyCache()
+    return _cache
+
+def get_taxonomy_limits():
+    """One rate limiter and semaphore for every job, taxonomy_rate caps all lookups together"""
+    global _limits
+    if _limits is None:
+        _limits = RateLimiter(CONFIG['taxonomy_rate']), asyncio.Semaphore(CONFIG['taxonomy_concurrency'])
+    return _limits
@@ -0,0 +1,40 @@
+import pandas as pd
+
+from store import read_hits_csv
+
+# Columns whose values repeat from hit to hit, stored as integer codes into one copy of each string
+CATEGORY_COLUMNS = ["query_title", "sci_name"]
+
+
+class HitTable:
+    """Hits of one query as columns, built from the result store for the anomaly report.
+
+    Anomaly detection and species grouping pass the table plus integer row
+    positions instead of per-row dicts or copied frames, rows only become
+    dicts for the few samples that are printed.
+    """
+
+    __slots__ = ("frame",)
+
+    def __init__(self, frame):
+        recode = {
+            name: "category" for name in CATEGORY_COLUMNS
+            if name in frame.columns and not isinstance(frame[name].dtype, pd.CategoricalDtype)
+        }
+        self.frame = frame.astype(recode) if recode else frame
+
+    @classmethod
+    def read_csv(cls, csv_path):
+        return cls(read_hits_csv(csv_path))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def column(self, name):
+        return self.frame[name]
+
+    def records(self, positions):
+        """Rows as dicts with missing values blanked, the way they read from CSV"""
+        rows = self.frame.iloc[positions].astype(object)
+        return rows.where(rows.notna(), '').to_dict('records')
+
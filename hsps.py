@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import numpy as np
+
+HSP_DIR = "hsps"
+# Per HSP fields kept from the BLAST JSON, "hit" is the row of the hit in the query CSV
+HSP_FIELDS = ["bit_score", "evalue", "identity", "align_len", "gaps", "query_from", "query_to", "hit_from", "hit_to"]
+AGGREGATE_COLUMNS = ["hsp_count", "query_coverage", "total_bit_score", "best_evalue", "merged_identity_pct"]
+
+
+class HspTable:
+    """Every HSP of one query as parallel columns, appended while the hits stream past"""
+
+    def __init__(self):
+        self.hit = []
+        self.columns = {field: [] for field in HSP_FIELDS}
+
+    def add_hit(self, row, hsps):
+        for hsp in hsps:
+            self.hit.append(row)
+            for field, values in self.columns.items():
+                value = hsp.get(field)
+                values.append(np.nan if value is None else value)
+
+    def arrays(self, start=0, first_hit=0):
+        """The HSPs from the start-th on as arrays, with hit rows counted from first_hit"""
+        arrays = {"hit": np.asarray(self.hit[start:], dtype=np.int32) - first_hit}
+        for field, values in self.columns.items():
+            arrays[field] = np.asarray(values[start:], dtype=np.float64)
+        return arrays
+
+    def save(self, folder_path, stem):
+        """Write the HSPs next to the query CSV as hsps/<stem>.npz"""
+        hsp_dir = Path(folder_path) / HSP_DIR
+        hsp_dir.mkdir(exist_ok=True)
+        np.savez_compressed(hsp_dir / f"{stem}.npz", **self.arrays())
+
+
+def aggregate_hsps(arrays, hit_count, query_len=None):
+    """Per hit HSP count, query coverage %, summed bit score, best e-value and merged identity %.
+
+    Hits are the integers in arrays["hit"], every column is computed with
+    array operations over all HSPs of the query at once.
+    """
+    hit = arrays["hit"].astype(np.int64)
+    result = {"hsp_count": np.bincount(hit, minlength=hit_count)}
+    result["total_bit_score"] = np.round(np.bincount(hit, weights=np.nan_to_num(arrays["bit_score"]), minlength=hit_count), 2)
+
+    best_evalue = np.full(hit_count, np.inf)
+    np.minimum.at(best_evalue, hit, np.where(np.isnan(arrays["evalue"]), np.inf, arrays["evalue"]))
+    result["best_evalue"] = np.where(np.isinf(best_evalue), np.nan, best_evalue)
+
+    identical = np.bincount(hit, weights=np.nan_to_num(arrays["identity"]), minlength=hit_count)
+    aligned = np.bincount(hit, weights=np.nan_to_num(arrays["align_len"]), minlength=hit_count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result["merged_identity_pct"] = np.round(np.where(aligned > 0, 100 * identical / aligned, np.nan), 2)
+
+    result["query_coverage"] = np.full(hit_count, np.nan)
+    if query_len and len(hit):
+        # Union of each hit's query intervals: sort by (hit, start), shift every hit onto
+        # its own stretch of the number line so one running maximum covers all hits
+        start = np.fmin(arrays["query_from"], arrays["query_to"])
+        end = np.fmax(arrays["query_from"], arrays["query_to"])
+        known = ~(np.isnan(start) | np.isnan(end))
+        h, start, end = hit[known], start[known].astype(np.int64), end[known].astype(np.int64)
+        order = np.lexsort((start, h))
+        h, start, end = h[order], start[order], end[order]
+        offset = h * (int(end.max(initial=0)) + 2)
+        start, end = start + offset, end + offset
+        reached = np.concatenate(([-1], np.maximum.accumulate(end)[:-1]))
+        covered = np.maximum(0, end - np.maximum(start, reached + 1) + 1)
+        coverage = np.bincount(h, weights=covered, minlength=hit_count)
+        result["query_coverage"] = np.round(np.minimum(100.0, 100 * coverage / query_len), 2)
+        result["query_coverage"][result["hsp_count"] == 0] = np.nan
+    return result
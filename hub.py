@@ -0,0 +1,68 @@
+import asyncio
+from collections import OrderedDict, deque
+
+from CONFIG import *
+
+
+class ProgressHub:
+    """In-process pub/sub for job progress.
+
+    Every job keeps a bounded replay buffer, so a client that connects late
+    or reconnects after a page reload first catches up and then follows the
+    live messages. Jobs publish without knowing who, if anyone, is listening.
+    """
+
+    def __init__(self):
+        self._history = OrderedDict()
+        self._subscribers = {}
+        self._finished = set()
+
+    def knows(self, job_id):
+        return job_id in self._history
+
+    def publish(self, job_id, message, final=False):
+        history = self._history.get(job_id)
+        if history is None:
+            history = self._history[job_id] = deque(maxlen=CONFIG['progress_replay'])
+            self._forget_old_jobs()
+        history.append(message)
+        for queue in self._subscribers.get(job_id, ()):
+            queue.put_nowait(message)
+        if final:
+            self._finished.add(job_id)
+            for queue in self._subscribers.get(job_id, ()):
+                queue.put_nowait(None)
+
+    async def subscribe(self, job_id):
+        """Yield the job's buffered messages, then live ones until the job finishes"""
+        queue = asyncio.Queue()
+        replay = list(self._history.get(job_id, ()))
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            for message in replay:
+                yield message
+            if job_id in self._finished:
+                return
+            while True:
+                message = await queue.get()
+                if message is None:
+                    return
+                yield message
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def _forget_old_jobs(self):
+        # Only finished jobs are dropped, their final state is still in the job store
+        while len(self._history) > CONFIG['progress_max_jobs']:
+            oldest = next((job_id for job_id in self._history if job_id in self._finished), None)
+            if oldest is None:
+                break
+            del self._history[oldest]
+            self._finished.discard(oldest)
+
+
+hub = ProgressHub()
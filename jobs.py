@@ -0,0 +1,107 @@
+import asyncio
+import sqlite3
+import time
+
+from CONFIG import *
+
+
+class JobStore:
+    """Durable record of every job and the RIDs of its chunks, so polling survives restarts"""
+
+    def __init__(self, path=None):
+        self.path = path or CONFIG['job_db_path']
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, state TEXT, message TEXT, created REAL, updated REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "job_id TEXT, idx INTEGER, query TEXT, rid TEXT, rtoe INTEGER, state TEXT, updated REAL, "
+            "PRIMARY KEY (job_id, idx))"
+        )
+        self.conn.commit()
+
+    def create_job(self, job_id):
+        now = time.time()
+        self.conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, 'queued', '', ?, ?)", (job_id, now, now))
+        self.conn.commit()
+
+    def set_job_state(self, job_id, state, message=""):
+        self.conn.execute(
+            "UPDATE jobs SET state = ?, message = ?, updated = ? WHERE id = ?",
+            (state, message, time.time(), job_id)
+        )
+        self.conn.commit()
+
+    def get_job(self, job_id):
+        return self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def unfinished_jobs(self):
+        rows = self.conn.execute(
+            "SELECT id FROM jobs WHERE state IN ('queued', 'running') ORDER BY created"
+        ).fetchall()
+        return [row["id"] for row in rows]
+
+    def add_chunks(self, job_id, queries):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, NULL, NULL, 'pending', ?)",
+            [(job_id, idx, query, now) for idx, query in enumerate(queries)]
+        )
+        self.conn.commit()
+
+    def get_chunks(self, job_id):
+        return self.conn.execute("SELECT * FROM chunks WHERE job_id = ? ORDER BY idx", (job_id,)).fetchall()
+
+    def set_chunk(self, job_id, idx, state, rid=None, rtoe=None):
+        self.conn.execute(
+            "UPDATE chunks SET state = ?, rid = ?, rtoe = ?, updated = ? WHERE job_id = ? AND idx = ?",
+            (state, rid, rtoe, time.time(), job_id, idx)
+        )
+        self.conn.commit()
+
+
+class JobQueue:
+    """Runs queued jobs on a fixed number of workers so bursts wait instead of all hitting NCBI"""
+
+    def __init__(self, runner):
+        self.runner = runner  # async runner(job_id)
+        self._queue = None
+        self._workers = []
+
+    def start(self, workers=None):
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(workers or CONFIG['job_workers'])]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def put(self, job_id):
+        if not self._workers:
+            self.start()
+        await self._queue.put(job_id)
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self.runner(job_id)
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+
+_store = None
+
+def get_job_store():
+    global _store
+    if _store is None:
+        _store = JobStore()
+    return _store
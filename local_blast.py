@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+import os
+import tempfile
+from pathlib import Path
+
+from CONFIG import *
+
+
+class LocalBlastBackend:
+    """Runs BLAST+ on this machine against a local database.
+
+    submit() starts a blastn/blastp process writing -outfmt 15 JSON and
+    returns a local run id, wait() returns the JSON file when it exits. At
+    most local_blast_workers processes run at once, each with
+    local_blast_threads threads.
+    """
+
+    name = "local"
+    label = "Local BLAST"
+
+    def __init__(self):
+        self._runs = {}
+        self._counter = itertools.count(1)
+        self._slots = None
+
+    def command(self, settings, query_path, out_path):
+        program = settings.program
+        executable = os.path.join(CONFIG['local_blast_bin_dir'], program) if CONFIG['local_blast_bin_dir'] else program
+        masking = "yes" if "L" in settings.filter else "no"
+        command = [
+            executable,
+            "-query", str(query_path),
+            "-db", CONFIG['local_blast_db'] or settings.database,
+            "-outfmt", "15",
+            "-out", str(out_path),
+            "-max_target_seqs", str(settings.hitlist_size),
+            "-num_threads", str(CONFIG['local_blast_threads']),
+        ]
+        # NCBI's FILTER letters: L masks low complexity regions, m only masks them for lookup
+        if program in ("blastn",):
+            command += ["-dust", masking]
+        elif program in ("blastp", "tblastn"):
+            command += ["-seg", masking]
+        if "m" in settings.filter:
+            command += ["-soft_masking", "true"]
+        return command
+
+    async def submit(self, fasta_string, settings):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(CONFIG['local_blast_workers'])
+        rid = f"LOCAL{os.getpid()}-{next(self._counter)}"
+        self._runs[rid] = asyncio.create_task(self._run(rid, fasta_string, settings))
+        return rid, None
+
+    async def wait(self, rid, rtoe=None):
+        task = self._runs.get(rid)
+        if task is None:
+            # Run ids do not outlive the process, a resumed chunk is searched again
+            return 9, None
+        try:
+            return await task
+        finally:
+            self._runs.pop(rid, None)
+
+    async def _run(self, rid, fasta_string, settings):
+        with tempfile.NamedTemporaryFile("w", prefix=f"{rid}_", suffix=".fasta", delete=False) as f:
+            f.write(fasta_string)
+        query_path = Path(f.name)
+        out_path = query_path.with_suffix(".json")
+        try:
+            async with self._slots:
+                process = await asyncio.create_subprocess_exec(
+                    *self.command(settings, query_path, out_path),
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    _, stderr = await process.communicate()
+                except asyncio.CancelledError:
+                    process.kill()
+                    await process.wait()
+                    out_path.unlink(missing_ok=True)
+                    raise
+        finally:
+            query_path.unlink(missing_ok=True)
+        if process.returncode != 0 or not out_path.exists():
+            with open("error.log", 'w+') as f:
+                f.write(stderr.decode("utf-8", "replace"))
+            out_path.unlink(missing_ok=True)
+            return 9, None
+        return 1, out_path
+
+    async def stop(self):
+        for task in self._runs.values():
+            task.cancel()
+        await asyncio.gather(*self._runs.values(), return_exceptions=True)
+        self._runs.clear()
@@ -2,21 +2,57 @@
 
 from fastapi import FastAPI, WebSocket, Request, HTTPException
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from starlette.responses import FileResponse, StreamingResponse
+from starlette.responses import FileResponse, Response, StreamingResponse
 import uvicorn
-from io import BytesIO
+import mimetypes
+import traceback
 from pathlib import Path
+from contextlib import asynccontextmanager
 from blast import *
+from bundle import bundle_etag, cached_bundle, iter_bundle, build_bundle
+from parallel import shutdown_file_pools
+from assets import IMMUTABLE, asset_variants, load_manifest, negotiate, render_index
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled client for every job so polls reuse keep-alive connections
+    await open_client()
+    job_queue.start()
+    # Pick up polling for RIDs that were in flight when the server last stopped
+    await resume_blast_jobs()
+    yield
+    await job_queue.stop()
+    await get_backend().stop()
+    await close_client()
+    shutdown_report_pool()
+    shutdown_file_pools()
+
+app = FastAPI(lifespan=lifespan)
 
 RESULTS_DIR = (Path.cwd() / "blast_res").resolve()
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
-# Use current directory for templates
-templates = Jinja2Templates(directory="templates")
+# Fingerprinted assets and the page are prepared once, requests only pick a variant
+ASSET_MANIFEST = load_manifest()
+ASSET_VARIANTS = asset_variants(ASSET_MANIFEST)
+# The appendix button only shows when the full report moves rows past a cap into it
+INDEX_PAGE = render_index(ASSET_MANIFEST, appendix=CONFIG['report_max_rows_per_query'] is not None)
+
+@app.get("/static/dist/{name}")
+async def dist_asset(request: Request, name: str):
+    """Content hashed assets never change under their name, so clients may cache them forever"""
+    variants = ASSET_VARIANTS.get(name)
+    if variants is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    encoding = negotiate(request.headers.get("accept-encoding", ""), variants)
+    headers = {"Cache-Control": IMMUTABLE, "Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(str(variants[encoding]), media_type=mimetypes.guess_type(name)[0], headers=headers)
+
+# Registered after the dist route, the mount would otherwise shadow it
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
@@ -34,9 +70,69 @@ def resolve_results_folder(folder_id: str) -> Path:
 
     return resolved
 
+async def rendered_report(folder_path: Path, report_name: str) -> Path:
+    """Render the report on first request, 404 when the job has no results to report on, 500 when the render fails"""
+    if not any(folder_path.glob("*.csv")):
+        raise HTTPException(status_code=404, detail="Report is not available")
+    try:
+        report_path = await ensure_report(folder_path, report_name)
+    except FileNotFoundError:
+        # The CSVs went away between the check and the render
+        raise HTTPException(status_code=404, detail="Report is not available")
+    except Exception as e:
+        print(f"Rendering {report_name} for {folder_path} failed: {e!r}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="Report could not be built")
+    if not report_path.exists():
+        # generate_report returns 1 without writing a PDF when there is nothing to report on
+        raise HTTPException(status_code=404, detail="Report is not available")
+    return report_path
+
+async def rendered_appendix(folder_path: Path) -> Path:
+    """The rows past report_max_rows_per_query, written alongside the full report"""
+    report_path = await rendered_report(folder_path, "BLAST_Full_Report.pdf")
+    appendix_path = report_path.with_name(f"{report_path.stem}_Appendix.pdf")
+    if not appendix_path.exists():
+        raise HTTPException(status_code=404, detail="Every row fits in the full report, there is no appendix")
+    return appendix_path
+
+async def csv_bundle_response(request: Request, folder_path: Path, folder_label: str):
+    """Zip of the job's CSVs, streamed while it is compressed and cached for repeat downloads"""
+    csv_paths = sorted(folder_path.glob("*.csv"))
+    etag = bundle_etag(csv_paths)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Content-Disposition": f'attachment; filename="{folder_label}_csv_bundle.zip"'
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    cache = CONFIG['cache_csv_bundle']
+    bundle_path = cached_bundle(folder_path, etag) if cache else None
+    if bundle_path is None and cache and "range" in request.headers:
+        # Byte ranges need the finished archive, e.g. a client resuming an interrupted download
+        bundle_path = await asyncio.to_thread(build_bundle, folder_path, csv_paths, etag)
+    if bundle_path is not None:
+        # FileResponse answers Range and If-Range requests against the cached file
+        return FileResponse(str(bundle_path), media_type="application/x-zip-compressed", headers=headers)
+
+    return StreamingResponse(
+        iter_bundle(folder_path, csv_paths, etag if cache else None),
+        media_type="application/x-zip-compressed",
+        headers=headers
+    )
+
 @app.get("/", response_class=HTMLResponse)
 async def get_home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    headers = {"ETag": INDEX_PAGE.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if INDEX_PAGE.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    encoding = negotiate(request.headers.get("accept-encoding", ""), INDEX_PAGE.encoded)
+    if encoding is None:
+        return HTMLResponse(INDEX_PAGE.body, headers=headers)
+    headers["Content-Encoding"] = encoding
+    return HTMLResponse(INDEX_PAGE.encoded[encoding], headers=headers)
 
 @app.get("/getconfig")
 async def getconfig(request: Request):
@@ -48,25 +144,10 @@ async def download_endpoint(request: Request, type: int, folderid: str):
     folder_label = folder_path.name or folder_path.as_posix()
 
     if type == 1:
-        csv_paths = sorted(folder_path.glob("*.csv"))
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for file_path in csv_paths:
-                if file_path.exists():
-                    zipf.write(file_path, arcname=file_path.name)
-
-        zip_buffer.seek(0)
-
-        # Return as streaming ZIP response
-        return StreamingResponse(
-            zip_buffer,
-            media_type="application/x-zip-compressed",
-            headers={"Content-Disposition": f"attachment; filename={folder_label}_csv_bundle.zip"}
-        )
-        print("download req for CSV")
+        return await csv_bundle_response(request, folder_path, folder_label)
     elif type == 2:
         return FileResponse(
-            str(folder_path / "BLAST_Full_Report.pdf"),
+            str(await rendered_report(folder_path, "BLAST_Full_Report.pdf")),
             media_type='application/pdf',
             filename=f'{folder_label}_full_report.pdf',
             headers={
@@ -75,13 +156,22 @@ async def download_endpoint(request: Request, type: int, folderid: str):
         )
     elif type == 3:
         return FileResponse(
-            str(folder_path / "anomaly_output.pdf"),
+            str(await rendered_report(folder_path, "anomaly_output.pdf")),
             media_type='application/pdf',
             filename=f'{folder_label}_anomaly_report.pdf',
             headers={
                 'Content-Disposition': f'attachment; filename="{folder_label}_anomaly_report.pdf"'
             }
         )
+    elif type == 5:
+        return FileResponse(
+            str(await rendered_appendix(folder_path)),
+            media_type='application/pdf',
+            filename=f'{folder_label}_full_report_appendix.pdf',
+            headers={
+                'Content-Disposition': f'attachment; filename="{folder_label}_full_report_appendix.pdf"'
+            }
+        )
     elif type == 4:
         return FileResponse(
             str(folder_path / "inputs.fasta"),
@@ -98,7 +188,7 @@ async def download_endpoint(request: Request, type: int, folderid: str):
     folder_label = folder_path.name or folder_path.as_posix()
     if type == 2:
         return FileResponse(
-            str(folder_path / "BLAST_Full_Report.pdf"),
+            str(await rendered_report(folder_path, "BLAST_Full_Report.pdf")),
             media_type='application/pdf',
             filename=f'{folder_label}_full_report.pdf',
             headers = {
@@ -108,7 +198,7 @@ async def download_endpoint(request: Request, type: int, folderid: str):
         )
     elif type == 3:
         return FileResponse(
-            str(folder_path / "anomaly_output.pdf"),
+            str(await rendered_report(folder_path, "anomaly_output.pdf")),
             media_type='application/pdf',
             filename=f'{folder_label}_anomaly_report.pdf',
             headers = {
@@ -116,21 +206,92 @@ async def download_endpoint(request: Request, type: int, folderid: str):
                 'Content-Type': 'application/pdf'
             }
         )
+    elif type == 5:
+        return FileResponse(
+            str(await rendered_appendix(folder_path)),
+            media_type='application/pdf',
+            filename=f'{folder_label}_full_report_appendix.pdf',
+            headers = {
+                'Content-Disposition': f'inline; filename="{folder_label}_full_report_appendix.pdf"',
+                'Content-Type': 'application/pdf'
+            }
+        )
 
 
 
+async def forward_progress(job_id: str, websocket: WebSocket):
+    # A failed send only ends this subscription, the job keeps running
+    async for message in job_events(job_id):
+        await websocket.send_text(json.dumps(message))
+
+def forwarder_done(task: asyncio.Task):
+    # Retrieve the send error of a client that went away, otherwise asyncio reports it as never retrieved
+    if not task.cancelled():
+        task.exception()
+
+def subscription_request(data: str):
+    """Return the folderid of a ["subscribe", folderid] message, None for a FASTA submission
+
+    Anything else raises ValueError.
+    """
+    if data.lstrip().startswith(">"):
+        return None
+    try:
+        message = json.loads(data)
+    except ValueError:
+        raise ValueError("Expected FASTA records starting with '>' or a subscribe message.")
+    if not (isinstance(message, list) and len(message) == 2 and message[0] == "subscribe" and isinstance(message[1], str)):
+        raise ValueError("Unknown message, expected [\"subscribe\", folderid].")
+    try:
+        resolve_results_folder(message[1])
+    except HTTPException as e:
+        raise ValueError(e.detail)
+    return message[1]
+
 @app.websocket("/")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    forwarders = []
     while True:
         try:
             data = await websocket.receive_text()
-            asyncio.create_task(run_blast_job(data, websocket))
+            try:
+                # A reloaded page sends ["subscribe", folderid] to catch up with its running job
+                job_id = subscription_request(data)
+            except ValueError as e:
+                # A malformed message gets an error frame, the connection and its subscriptions stay open
+                await websocket.send_text(json.dumps(["Error", str(e)]))
+                continue
+            if job_id is None:
+                job_id = await submit_blast_job(data)
+            forwarder = asyncio.create_task(forward_progress(job_id, websocket))
+            forwarder.add_done_callback(forwarder_done)
+            forwarders.append(forwarder)
 
         except Exception as e:
+            for forwarder in forwarders:
+                forwarder.cancel()
             await websocket.close()
             break
 
+@app.get("/results")
+async def results_endpoint(request: Request, folderid: str):
+    """Summaries of every query parsed so far, lets a reloaded page fill its result table"""
+    folder_path = resolve_results_folder(folderid)
+    csv_paths = sorted(folder_path.glob("*.csv"))
+    return await asyncio.to_thread(result_frames, csv_paths, get_settings())
+
+@app.get("/events")
+async def events_endpoint(request: Request, folderid: str):
+    """Server-sent events stream of a job's progress, for clients without a websocket"""
+    resolve_results_folder(folderid)
+
+    async def stream():
+        async for message in job_events(folderid):
+            yield f"data: {json.dumps(message)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,46 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from CONFIG import *
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_file_pool(executor, workers):
+    """The pool for (executor, workers), created once so process workers keep their imports between reports"""
+    with _pools_lock:
+        pool = _pools.get((executor, workers))
+        if pool is None:
+            if executor == "process":
+                # spawn, the caller may itself be a pool worker with threads of its own
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers)
+            _pools[(executor, workers)] = pool
+        return pool
+
+
+def shutdown_file_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(cancel_futures=True)
+        _pools.clear()
+
+
+def map_files(func, *iterables, workers=None, executor=None):
+    """map() over per-file work on a thread or process pool, results come back in input order.
+
+    With one worker (or one item) it runs inline, so the parallel and
+    sequential paths produce the same results in the same order.
+    """
+    items = list(zip(*iterables))
+    workers = workers or CONFIG['report_file_workers']
+    executor = executor or CONFIG['report_file_executor']
+    if workers <= 1 or len(items) < 2:
+        return [func(*item) for item in items]
+    pool = get_file_pool(executor, workers)
+    # Several files per task keep the pickling overhead of small files down
+    chunksize = max(1, len(items) // (workers * 4)) if executor == "process" else 1
+    return list(pool.map(func, *zip(*items), chunksize=chunksize))
@@ -0,0 +1,113 @@
+import asyncio
+import random
+
+from CONFIG import *
+from ratelimit import RateLimiter
+
+
+class PendingRid:
+    def __init__(self, future, due):
+        self.future = future
+        self.due = due
+        self.attempt = 0
+        self.errors = 0
+
+
+class PollScheduler:
+    """Owns every outstanding RID and polls them from one loop.
+
+    Jobs call wait(rid, rtoe) and sleep on a future until the RID is finished.
+    The first check happens after NCBI's RTOE estimate, later checks back off
+    exponentially with jitter, and all checks share one rate limit. Checks
+    only read the status, fetching the results is left to the waiting job so
+    a large download never holds up the other RIDs.
+    """
+
+    def __init__(self, check):
+        self.check = check  # async check(rid) -> code, 0 means still waiting
+        self._pending = {}
+        self._task = None
+        self._wakeup = None
+        self._limiter = None
+
+    async def wait(self, rid, rtoe=None):
+        loop = asyncio.get_running_loop()
+        self._ensure_running()
+        delay = rtoe if rtoe else CONFIG['poll_initial_delay']
+        future = loop.create_future()
+        self._pending[rid] = PendingRid(future, loop.time() + self._jitter(delay))
+        self._wakeup.set()
+        try:
+            return await future
+        finally:
+            self._pending.pop(rid, None)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        for entry in self._pending.values():
+            if not entry.future.done():
+                entry.future.cancel()
+        self._pending.clear()
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            # Every job's checks together stay under poll_rate per second
+            self._limiter = RateLimiter(CONFIG['poll_rate'])
+            self._task = asyncio.create_task(self._run())
+
+    def _jitter(self, delay):
+        spread = CONFIG['poll_jitter']
+        return delay * random.uniform(1 - spread, 1 + spread)
+
+    def _backoff(self, attempt):
+        delay = CONFIG['poll_backoff_base'] * CONFIG['poll_backoff_factor'] ** attempt
+        return self._jitter(min(delay, CONFIG['poll_max_delay']))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            now = loop.time()
+            live = {rid: entry for rid, entry in self._pending.items() if not entry.future.done()}
+            due = sorted((rid for rid, entry in live.items() if entry.due <= now), key=lambda rid: live[rid].due)
+            if not due:
+                timeout = min((entry.due for entry in live.values()), default=now + 3600) - now
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = due[:CONFIG['poll_batch_size']]
+            await asyncio.gather(*[self._poll(rid, live[rid]) for rid in batch])
+
+    async def _poll(self, rid, entry):
+        await self._limiter.wait()
+        try:
+            code = await self.check(rid)
+        except Exception as e:
+            if entry.future.done():
+                return
+            # A timeout or dropped connection says nothing about the search, check again later
+            entry.errors += 1
+            if entry.errors >= CONFIG['poll_max_errors']:
+                entry.future.set_exception(e)
+                return
+            print(f"Status check of {rid} failed ({entry.errors}/{CONFIG['poll_max_errors']}): {e}")
+            code = 0
+        else:
+            entry.errors = 0
+        if entry.future.done():
+            return
+        if code == 0:
+            entry.attempt += 1
+            entry.due = asyncio.get_running_loop().time() + self._backoff(entry.attempt)
+        else:
+            entry.future.set_result(code)
@@ -0,0 +1,114 @@
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from CONFIG import *
+
+# 2 bit nucleotide codes, 4 marks anything that is not ACGT (N, IUPAC codes, gaps)
+CODES = np.full(256, 4, dtype=np.uint8)
+for base, code in zip(b"ACGT", range(4)):
+    CODES[base] = code
+    CODES[base + 32] = code
+
+
+def encode(sequence):
+    return CODES[np.frombuffer(sequence.encode("ascii", "replace"), dtype=np.uint8)]
+
+
+def kmers(sequence, k):
+    """Canonical k-mers of a sequence as uint64, windows with non ACGT bases are dropped"""
+    codes = encode(sequence)
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    invalid = np.concatenate(([0], np.cumsum(codes == 4)))
+    valid = invalid[k:] - invalid[:n] == 0
+    values = np.where(codes == 4, 0, codes).astype(np.uint64)
+    forward = np.zeros(n, dtype=np.uint64)
+    reverse = np.zeros(n, dtype=np.uint64)
+    # One pass per k-mer position keeps memory linear in the sequence length
+    for j in range(k):
+        window = values[j:j + n]
+        forward |= window << np.uint64(2 * (k - 1 - j))
+        reverse |= (np.uint64(3) - window) << np.uint64(2 * j)
+    return np.minimum(forward, reverse)[valid]
+
+
+def iter_fasta(fasta_path):
+    """Yield (title, sequence) records from a FASTA file without reading it whole"""
+    title, lines = None, []
+    with open(fasta_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                if title is not None:
+                    yield title, "".join(lines)
+                title, lines = line[1:].strip(), []
+            elif line:
+                lines.append(line)
+    if title is not None:
+        yield title, "".join(lines)
+
+
+class KmerIndex:
+    """Sorted distinct canonical k-mers of a reference FASTA"""
+
+    def __init__(self, kmers, k):
+        self.kmers = kmers
+        self.k = k
+
+    @classmethod
+    def from_fasta(cls, fasta_path, k):
+        parts = [np.unique(kmers(sequence, k)) for _, sequence in iter_fasta(fasta_path)]
+        return cls(np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.uint64), k)
+
+    def containment(self, sequences):
+        """Fraction of each sequence's distinct k-mers found in the reference, and how many it has"""
+        parts = [np.unique(kmers(sequence, self.k)) for sequence in sequences]
+        counts = np.array([len(part) for part in parts], dtype=np.int64)
+        if not counts.sum() or not len(self.kmers):
+            return np.zeros(len(sequences)), counts
+        # Every query k-mer is looked up in a single searchsorted over the reference
+        query_kmers = np.concatenate(parts)
+        owner = np.repeat(np.arange(len(sequences)), counts)
+        positions = np.searchsorted(self.kmers, query_kmers).clip(max=len(self.kmers) - 1)
+        found = self.kmers[positions] == query_kmers
+        shared = np.bincount(owner[found], minlength=len(sequences))
+        return shared / np.maximum(counts, 1), counts
+
+
+_indexes = {}
+# Jobs call in from worker threads, the first one builds the index and the others wait for it
+_index_lock = threading.Lock()
+
+def get_kmer_index(fasta_path=None, k=None):
+    """The index of a reference FASTA, kept on disk next to it and rebuilt when the FASTA changes"""
+    fasta_path = Path(fasta_path or CONFIG['prefilter_reference'])
+    k = k or CONFIG['prefilter_k']
+    with _index_lock:
+        mtime = fasta_path.stat().st_mtime_ns
+        key = (fasta_path.resolve(), k)
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        index_path = fasta_path.with_name(f"{fasta_path.name}.k{k}.npy")
+        if index_path.exists() and index_path.stat().st_mtime_ns >= mtime:
+            index = KmerIndex(np.load(index_path), k)
+        else:
+            index = KmerIndex.from_fasta(fasta_path, k)
+            np.save(index_path, index.kmers)
+        _indexes[key] = (mtime, index)
+        return index
+
+
+def split_confident(records, index=None):
+    """Split (title, sequence) records into [(title, containment)] confident matches and the rest"""
+    index = index or get_kmer_index()
+    if not records:
+        return [], []
+    scores, counts = index.containment([sequence for _, sequence in records])
+    confident = (scores >= CONFIG['prefilter_threshold']) & (counts >= CONFIG['prefilter_min_kmers'])
+    matched = [(title, float(score)) for (title, _), score, hit in zip(records, scores, confident) if hit]
+    ambiguous = [record for record, hit in zip(records, confident) if not hit]
+    return matched, ambiguous
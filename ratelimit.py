@@ -0,0 +1,17 @@
+import asyncio
+
+
+class RateLimiter:
+    """Spaces call starts so all callers together stay under `rate` per second"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next_slot = 0.0
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
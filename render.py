@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from CONFIG import *
+from bundle import bundle_etag
+from enrich import TAXONOMY_NAME
+from report import generate_report, generate_blast_full_report
+from taxdump import index_version
+
+REPORTS = {
+    "anomaly_output.pdf": generate_report,
+    "BLAST_Full_Report.pdf": generate_blast_full_report,
+}
+
+# CONFIG entries that change what a report contains
+REPORT_OPTIONS = ['normal_sample_size', 'anomaly_group_rank', 'report_rows_per_table', 'report_max_rows_per_query']
+
+_pool = None
+_renders = {}
+
+def get_report_pool():
+    global _pool
+    if _pool is None:
+        # spawn, forking a process that runs the event loop and its threads is not safe
+        _pool = ProcessPoolExecutor(
+            max_workers=CONFIG['report_workers'],
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+def shutdown_report_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+async def render_report(folder_path, report_name, key=None):
+    """Build one PDF report in the worker pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(get_report_pool(), REPORTS[report_name], folder_path)
+    report_path = Path(folder_path) / report_name
+    if key is not None and report_path.exists():
+        (Path(folder_path) / f"{report_name}.key").write_text(key)
+    return report_name
+
+async def render_reports(folder_path):
+    """Build every report in parallel, yielding each name as its PDF is finished"""
+    for finished in asyncio.as_completed([ensure_report(folder_path, name) for name in REPORTS]):
+        yield (await finished).name
+
+def report_key(folder_path):
+    """What a rendered report depends on: the settings, the report options, the set of CSVs, the taxonomy and the taxdump index"""
+    csv_paths = sorted(Path(folder_path).glob("*.csv"))
+    options = [get_settings().dump()] + [CONFIG[name] for name in REPORT_OPTIONS]
+    # Anomaly groups by rank come from the taxdump index, a rebuilt index regroups them
+    if CONFIG['anomaly_group_rank']:
+        options.append(index_version())
+    digest = hashlib.sha256(json.dumps(options, default=str).encode("utf-8"))
+    # Name, size and mtime of every CSV, so added, rewritten and deleted queries all change the key
+    digest.update(bundle_etag(csv_paths).encode("utf-8"))
+    # taxonomy.json is written by the enrichment stage after the CSVs
+    taxonomy_path = Path(folder_path) / TAXONOMY_NAME
+    if taxonomy_path.exists():
+        digest.update(str(taxonomy_path.stat().st_mtime_ns).encode("utf-8"))
+    return digest.hexdigest()
+
+def report_is_fresh(folder_path, report_name, key=None):
+    """A rendered report is reusable while it was built from the current settings and CSVs"""
+    folder = Path(folder_path)
+    report_path = folder / report_name
+    key_path = folder / f"{report_name}.key"
+    if not report_path.exists() or not key_path.exists():
+        return False
+    return key_path.read_text() == (key or report_key(folder))
+
+async def ensure_report(folder_path, report_name):
+    """Render a report the first time it is requested and reuse it afterwards
+
+    Concurrent requests for the same report wait on a single render.
+    """
+    report_path = Path(folder_path) / report_name
+    # Taken before rendering, CSVs written meanwhile make the next request render again
+    report_key_now = report_key(folder_path)
+    if report_is_fresh(folder_path, report_name, report_key_now):
+        return report_path
+    key = (report_path.resolve().as_posix(), report_name)
+    task = _renders.get(key)
+    if task is None:
+        task = asyncio.ensure_future(render_report(folder_path, report_name, report_key_now))
+        _renders[key] = task
+        task.add_done_callback(lambda _: _renders.pop(key, None))
+    # A client that disconnects must not cancel the render other requests are waiting on
+    await asyncio.shield(task)
+    return report_path
@@ -1,4 +1,5 @@
 import os
+import re
 import csv
 from pathlib import Path
 from reportlab.lib.pagesizes import A4
@@ -14,60 +15,108 @@ from datetime import datetime
 from CONFIG import *
 import textwrap
 import pandas as pd
+import numpy as np
 from typing import List, Dict, Any
+from store import load_results
+from taxdump import get_taxonomy_index, index_version
+from hits import HitTable
+from parallel import map_files
+from aggregates import cached_aggregates
+from enrich import hit_taxonomy, load_taxonomy
 
 
-def is_anomaly(title, non_anomaly_keywords):
-    """Check if a result is anomalous based on absence of non-anomaly keywords"""
-    if not title:
-        return True  # Empty title is considered anomalous
-    title_lower = title.lower()
-    return not any(keyword.lower() in title_lower for keyword in non_anomaly_keywords)
-
-def extract_species_group(title):
-    """Extract species group from title - improved version"""
-    if not title:
-        return "Unknown"
-    
-    # Try to extract genus and species (first 2 meaningful words)
-    words = title.split()
-    if len(words) >= 2:
-        # Look for the genus (first capitalized word typically)
-        for i, word in enumerate(words):
-            if word and word[0].isupper() and len(word) > 1:
-                # Try to get genus and next word for species
-                if i + 1 < len(words):
-                    # Clean the species name (remove commas, etc.)
-                    species_word = words[i + 1].rstrip(',.;')
-                    return f"{word} {species_word}"
-                return word
-    return title[:50]  # Return first 50 chars if we can't extract properly
-
-def group_anomalies(anomalies):
-    """Group anomalies by species and return grouped data with counts"""
-    grouped = defaultdict(list)
-    
-    for anomaly in anomalies:
-        species_group = extract_species_group(anomaly.get('subject_title', ''))
-        grouped[species_group].append(anomaly)
-    
-    grouped_data = []
-    for species, records in grouped.items():
-        grouped_data.append({
-            'species_group': species,
-            'count': len(records),
-            'sample': records[0] if records else {},
-            'all_records': records
-        })
-    
-    return sorted(grouped_data, key=lambda x: x['count'], reverse=True)
+def uppercase_class():
+    """Regex class of every character str.isupper() accepts, Greek and Cyrillic capitals included.
+
+    No character past the first two Unicode planes is uppercase.
+    """
+    upper = [c for c in range(0x20000) if chr(c).isupper()]
+    ranges = []
+    for c in upper:
+        if ranges and ranges[-1][1] == c - 1:
+            ranges[-1][1] = c
+        else:
+            ranges.append([c, c])
+    return "[" + "".join(re.escape(chr(a)) if a == b else f"{re.escape(chr(a))}-{re.escape(chr(b))}" for a, b in ranges) + "]"
+
+# Genus is the first capitalised word (str.isupper()) of two or more characters, species the word after it
+SPECIES_PATTERN = r'(?:^|\s)(' + uppercase_class() + r'\S+)(?:\s+(\S+))?'
+
+def compile_keywords(non_anomaly_keywords):
+    """Fold the non-anomaly keywords into one case-insensitive regex"""
+    return re.compile('|'.join(re.escape(keyword) for keyword in non_anomaly_keywords), re.IGNORECASE)
+
+def anomaly_mask(titles, pattern):
+    """True for titles that contain none of the non-anomaly keywords"""
+    titles = titles.fillna('').astype(str)
+    return ~titles.str.contains(pattern) | (titles == '')  # Empty title is considered anomalous
+
+def species_groups(titles):
+    """Extract species group (genus and species) from every title at once"""
+    # Hits repeat titles a lot, so only the distinct ones go through the regex
+    titles_index = titles.index
+    codes, uniques = pd.factorize(titles.fillna('').astype(str))
+    titles = pd.Series(uniques, dtype=object)
+    parts = titles.str.extract(SPECIES_PATTERN)
+    genus = parts[0]
+    # Clean the species name (remove commas, etc.)
+    species = parts[1].str.rstrip(',.;')
+    groups = genus.where(species.isna(), genus + ' ' + species)
+    # Return first 50 chars if we can't extract properly
+    two_words = titles.str.contains(r'\S\s+\S')
+    groups = groups.where(groups.notna() & two_words, titles.str[:50])
+    groups = groups.where(titles != '', 'Unknown').to_numpy()
+    return pd.Series(groups[codes], index=titles_index, dtype=object)
+
+def anomaly_groups(titles, taxids=None):
+    """Group key of every anomaly, the ancestor at anomaly_group_rank when the local taxonomy knows the taxid"""
+    groups = species_groups(titles)
+    rank = CONFIG['anomaly_group_rank']
+    index = get_taxonomy_index() if rank else None
+    if index is None or taxids is None:
+        return groups
+    names = index.group_names(taxids.to_numpy(), rank)
+    # Hits without a taxid or outside the index keep their title based group
+    return pd.Series(np.where(pd.isna(names), groups.to_numpy(), names), index=groups.index, dtype=object)
+
+def group_anomalies(hits, positions):
+    """Group the anomalies at `positions` of a HitTable by species, groups hold row positions, not copies"""
+    if not len(positions):
+        return []
+    titles = hits.column('subject_title').iloc[positions]
+    taxids = hits.column('taxid').iloc[positions] if 'taxid' in hits.frame.columns else None
+    codes, species_names = pd.factorize(anomaly_groups(titles, taxids).to_numpy())
+    counts = np.bincount(codes)
+    # Largest groups first, ties keep the order the groups were first seen in
+    order = np.argsort(-counts, kind='stable')
+    members = np.argsort(codes, kind='stable')
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    group_positions = {code: positions[members[bounds[code]:bounds[code + 1]]] for code in order}
+    samples = hits.records([group_positions[code][0] for code in order])
+
+    return [
+        {
+            'species_group': species_names[code],
+            'count': int(counts[code]),
+            'sample': sample,
+            'positions': group_positions[code]
+        }
+        for code, sample in zip(order, samples)
+    ]
 
 def process_csv_file(csv_path):
     """Process a single CSV file and return data for PDF"""
-    filename = os.path.basename(csv_path)
+    pattern = compile_keywords([get_settings().non_anomaly_keyword])
+    return process_hits(os.path.basename(csv_path), HitTable.read_csv(csv_path), pattern)
+
+def process_hits(filename, hits, pattern):
+    """Process the hits of one query file (a HitTable or DataFrame) and return data for PDF"""
+    if not isinstance(hits, HitTable):
+        hits = HitTable(hits)
     data = {
         'filename': filename,
-        'anomalies': [],
+        'hits': hits,
+        'anomaly_positions': np.empty(0, dtype=np.intp),
         'grouped_anomalies': [],
         'normal_samples': [],
         'total_records': 0,
@@ -76,33 +125,47 @@ def process_csv_file(csv_path):
     }
     
     try:
-        with open(csv_path, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            all_normal = []
-            
-            for row in reader:
-                data['total_records'] += 1
-                
-                # Use subject_title instead of title for BLAST results
-                title_to_check = row.get('subject_title', '')
-                if is_anomaly(title_to_check, [load_config()[4]]):
-                    data['anomalies'].append(row)
-                    data['anomaly_count'] += 1
-                else:
-                    all_normal.append(row)
-                    data['normal_count'] += 1
-            
-            data['grouped_anomalies'] = group_anomalies(data['anomalies'])
-            
-            # Take random sample of normal results
-            sample_size = min(CONFIG['normal_sample_size'], len(all_normal))
-            data['normal_samples'] = random.sample(all_normal, sample_size) if all_normal else []
+        # Use subject_title instead of title for BLAST results
+        mask = anomaly_mask(hits.column('subject_title'), pattern).to_numpy()
+        anomalies = np.flatnonzero(mask)
+        normals = np.flatnonzero(~mask)
+        data['anomaly_positions'] = anomalies
+        data['total_records'] = len(hits)
+        data['anomaly_count'] = len(anomalies)
+        data['normal_count'] = len(normals)
+        
+        data['grouped_anomalies'] = group_anomalies(hits, anomalies)
+        
+        # Take random sample of normal results, seeded by file so every worker layout picks the same rows
+        sample_size = min(CONFIG['normal_sample_size'], len(normals))
+        picked = random.Random(filename).sample(range(len(normals)), sample_size)
+        data['normal_samples'] = hits.records(normals[picked])
             
     except Exception as e:
-        print(f"Error processing {csv_path}: {str(e)}")
+        print(f"Error processing {filename}: {str(e)}")
     
     return data
 
+def process_file(filename, df, pattern):
+    """process_hits reduced to what the anomaly report prints, small enough for the pool and the sidecars"""
+    data = process_hits(filename, df, pattern)
+    return {
+        'filename': data['filename'],
+        'grouped_anomalies': [
+            {'species_group': group['species_group'], 'count': group['count'], 'sample': group['sample']}
+            for group in data['grouped_anomalies']
+        ],
+        'normal_samples': data['normal_samples'],
+        'total_records': data['total_records'],
+        'anomaly_count': data['anomaly_count'],
+        'normal_count': data['normal_count']
+    }
+
+def anomaly_params(settings):
+    """Everything besides a file's hits that its anomaly report data depends on"""
+    rank = CONFIG['anomaly_group_rank']
+    return [settings.non_anomaly_keyword, CONFIG['normal_sample_size'], rank, index_version() if rank else None]
+
 def truncate_text(text, max_length=80):
     """Truncate text to maximum length and add ellipsis if needed"""
     if not text:
@@ -250,9 +313,11 @@ def create_detailed_section(title, records, max_rows=8, max_table_width=7.0*inch
     
     return elements
 
-def create_pdf_report(all_data, folder_path):
-    """Create PDF report from processed data"""
+def create_pdf_report(all_data, folder_path, settings=None, taxonomy=None):
+    """Create PDF report from processed data, taxonomy ({taxon key: record}) adds the enriched names of each group"""
     folder_path = Path(folder_path)
+    settings = settings or get_settings()
+    taxonomy = taxonomy or {}
     doc = SimpleDocTemplate(str(folder_path / "anomaly_output.pdf"), pagesize=A4)
     styles = getSampleStyleSheet()
     story = []
@@ -276,7 +341,7 @@ def create_pdf_report(all_data, folder_path):
     )
     
     # Title and metadata
-    story.append(Paragraph(load_config()[5]+" BLAST Anomaly Report", title_style))
+    story.append(Paragraph(settings.species_name+" BLAST Anomaly Report", title_style))
     story.append(Paragraph(
         f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", 
         styles['Normal']
@@ -307,7 +372,7 @@ def create_pdf_report(all_data, folder_path):
     folder_label = folder_path.name or folder_path.as_posix()
     config_text = f"""
     <b>Analysis Configuration:</b><br/>
-    Non-anomaly keywords: {', '.join([load_config()[4]])}<br/>
+    Non-anomaly keywords: {', '.join([settings.non_anomaly_keyword])}<br/>
     Normal sample size: {CONFIG['normal_sample_size']}<br/>
     BatchBLAST ID: {folder_label}
     """
@@ -364,13 +429,20 @@ def create_pdf_report(all_data, folder_path):
             
             # Group summary
             group_data = [["Species Group", "Count", "Percentage"]]
+            if taxonomy:
+                group_data[0] += ["Common Name", "Type"]
             for group in data['grouped_anomalies']:
                 group_pct = (group['count'] / data['anomaly_count'] * 100)
-                group_data.append([
+                row = [
                     truncate_text(group['species_group'], 40),
                     str(group['count']),
                     f"{group_pct:.1f}%"
-                ])
+                ]
+                if taxonomy:
+                    # Resolved from the group's sample hit by the enrichment stage
+                    record = hit_taxonomy(taxonomy, group['sample']) or {}
+                    row += [truncate_text(record.get('common_name', ''), 25), truncate_text(record.get('type', ''), 20)]
+                group_data.append(row)
             
             group_table = create_styled_table(group_data[0], group_data[1:], 'anomaly')
             story.append(group_table)
@@ -457,18 +529,49 @@ def generate_report(folder_path):
     if not results_folder.exists():
         return 1
 
-    csv_files = sorted(results_folder.glob('*.csv'))
-
-    if not csv_files:
+    if not any(results_folder.glob('*.csv')):
         return 1
 
-    all_data = []
-
-    for csv_file in csv_files:
-        data = process_csv_file(str(csv_file))
-        all_data.append(data)
-
-    create_pdf_report(all_data, results_folder)
+    # One config snapshot and one compiled keyword pattern for the whole job
+    settings = get_settings()
+    pattern = compile_keywords([settings.non_anomaly_keyword])
+
+    def compute(stems):
+        results = load_results(results_folder, sources=stems)
+        filenames = [f"{stem}.csv" for stem in results]
+        return dict(zip(results, map_files(process_file, filenames, results.values(), [pattern] * len(results))))
+
+    # Files already seen with the same content reuse their stored aggregates, only new or changed ones are read
+    stems = [csv_file.stem for csv_file in sorted(results_folder.glob('*.csv'))]
+    aggregates = cached_aggregates(results_folder, "anomaly", stems, compute, anomaly_params(settings))
+    all_data = [aggregates[stem] for stem in stems]
+
+    create_pdf_report(all_data, results_folder, settings, load_taxonomy(results_folder))
+
+# Columns the summary page is computed from
+SUMMARY_COLUMNS = ['query_title', 'sci_name', 'taxid', 'identity_pct']
+
+def counts_by_file(source, values, file_count):
+    """[[value, hits], ...] of every file, values in the order they first appear in the file"""
+    codes, uniques = pd.factorize(values)
+    known = codes >= 0
+    width = max(len(uniques), 1)
+    # One code per (file, value) pair, numbered in order of appearance
+    pair_codes, pairs = pd.factorize(source[known] * width + codes[known])
+    hits = np.bincount(pair_codes, minlength=len(pairs))
+    counts = [[] for _ in range(file_count)]
+    for pair, count in zip(pairs.tolist(), hits.tolist()):
+        file_code, value_code = divmod(pair, width)
+        counts[file_code].append([uniques[value_code], count])
+    return counts
+
+def merged_counts(per_file_counts):
+    """Sum per-file [[value, hits], ...] lists, values in the order they first appear across the files"""
+    counts = {}
+    for pairs in per_file_counts:
+        for value, hits in pairs:
+            counts[value] = counts.get(value, 0) + hits
+    return pd.Series(counts, dtype='int64')
 
 class BLASTReportGenerator:
     def __init__(self, output_filename: str = "BLAST_Report.pdf"):
@@ -501,19 +604,9 @@ class BLASTReportGenerator:
 
     def read_csv_files(self, folder_path: Path) -> Dict[str, pd.DataFrame]:
         try:
-            folder = Path(folder_path)
-            csv_files = sorted(folder.glob("*.csv"))
-
-            if not csv_files:
-                raise FileNotFoundError(f"No CSV files found in {folder_path}")
-
-
             dataframes = {}
-            for csv_file in csv_files:
-                filename = csv_file.name
-                filename_without_ext = csv_file.stem
-
-                df = pd.read_csv(csv_file)
+            # Typed columns come from the job's Parquet store instead of re-parsing every CSV
+            for filename_without_ext, df in load_results(folder_path).items():
                 # Select only the required columns
                 required_columns = [
                     'query_title',     # <-- include query info
@@ -537,35 +630,63 @@ class BLASTReportGenerator:
         except Exception as e:
             raise
 
-    def generate_summary_stats(self, dataframes: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
-        total_hits = 0
-        all_files_data = []
-        all_species = []
-        all_queries = []
-    
-        for filename, df in dataframes.items():
-            # Accumulate global lists for cross-file aggregation
-            if 'sci_name' in df.columns:
-                all_species.extend(df['sci_name'].dropna().tolist())
-            if 'query_title' in df.columns:
-                all_queries.extend(df['query_title'].dropna().tolist())
-    
-            file_stats = {
+    def file_summaries(self, dataframes: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, Any]]:
+        """Per-file statistics and species/query hit counts from one concatenated frame and a single groupby."""
+        filenames = list(dataframes)
+        combined = pd.concat([df.reindex(columns=SUMMARY_COLUMNS) for df in dataframes.values()], ignore_index=True)
+        # Every hit tagged with the integer code of its file, files without hits keep an empty group
+        lengths = [len(df) for df in dataframes.values()]
+        source = np.repeat(np.arange(len(filenames)), lengths)
+        combined['source'] = pd.Categorical.from_codes(source, categories=filenames)
+        for name in ('sci_name', 'query_title'):
+            if not isinstance(combined[name].dtype, pd.CategoricalDtype):
+                combined[name] = combined[name].astype('category')
+
+        per_file = combined.groupby('source', observed=False).agg(
+            hits=('identity_pct', 'size'),
+            avg_identity=('identity_pct', 'mean'),
+            unique_taxids=('taxid', 'nunique'),
+        )
+        species = counts_by_file(source, combined['sci_name'], len(filenames))
+        queries = counts_by_file(source, combined['query_title'], len(filenames))
+        return {
+            filename: {
+                'hits': int(row.hits),
+                'avg_identity': row.avg_identity,
+                'unique_taxids': int(row.unique_taxids),
+                'species': species[i],
+                'queries': queries[i]
+            }
+            for i, (filename, row) in enumerate(zip(filenames, per_file.itertuples()))
+        }
+
+    def generate_summary_stats(self, dataframes: Dict[str, pd.DataFrame], summaries: Dict[str, Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Merge per-file summaries (computed here when not given) into the report's statistics."""
+        if summaries is None:
+            summaries = self.file_summaries(dataframes)
+        file_stats = [
+            {
                 'filename': filename,
-                'hits': len(df),
-                'avg_identity': df['identity_pct'].mean() if 'identity_pct' in df.columns else 0,
-                'unique_taxids': df['taxid'].nunique() if 'taxid' in df.columns else 0,
+                'hits': summaries[filename]['hits'],
+                'avg_identity': summaries[filename]['avg_identity'],
+                'unique_taxids': summaries[filename]['unique_taxids'],
                 'data': df  # Keep dataframe reference for deeper use later
             }
-            all_files_data.append(file_stats)
-            total_hits += len(df)
-    
+            for filename, df in dataframes.items()
+        ]
+        avg_identity = pd.Series([f['avg_identity'] for f in file_stats], dtype=float)
+
         return {
-            'total_hits': total_hits,
+            'total_hits': sum(f['hits'] for f in file_stats),
             'unique_files': len(dataframes),
-            'file_stats': all_files_data,
-            'all_species': all_species,
-            'all_queries': all_queries
+            'file_stats': file_stats,
+            # Spread of the per-file average identities, files without hits are skipped
+            'avg_identity': avg_identity.mean(),
+            'max_identity': avg_identity.max(),
+            'min_identity': avg_identity.min(),
+            'unique_subjects': sum(f['unique_taxids'] for f in file_stats),
+            'species_counts': merged_counts(summaries[filename]['species'] for filename in dataframes),
+            'query_counts': merged_counts(summaries[filename]['queries'] for filename in dataframes)
         }
 
 
@@ -580,27 +701,19 @@ class BLASTReportGenerator:
         """Create the summary section of the report dynamically using real data."""
         elements = []
     
-        elements.append(Paragraph(load_config()[5]+" BLAST Full Report", self.styles['CustomTitle']))
+        elements.append(Paragraph(get_settings().species_name+" BLAST Full Report", self.styles['CustomTitle']))
         elements.append(Spacer(1, 0.3 * inch))
     
         elements.append(Paragraph("<b>Summary Statistics</b>", self.styles['CustomHeading']))
         elements.append(Spacer(1, 0.1 * inch))
     
-        # Dynamically compute overall metrics
-        avg_identity = (
-            sum(f['avg_identity'] for f in stats['file_stats']) / len(stats['file_stats'])
-            if stats['file_stats'] else 0
-        )
-        max_identity = max(
-            (f['avg_identity'] for f in stats['file_stats'] if f['avg_identity'] is not None), default=0
-        )
-        min_identity = min(
-            (f['avg_identity'] for f in stats['file_stats'] if f['avg_identity'] is not None), default=0
-        )
+        avg_identity = stats['avg_identity']
+        max_identity = stats['max_identity']
+        min_identity = stats['min_identity']
     
         unique_queries = stats['unique_files']
         total_hits = stats['total_hits']
-        unique_subjects = sum(f['unique_taxids'] for f in stats['file_stats'])
+        unique_subjects = stats['unique_subjects']
         unique_species = unique_subjects  # approximate until taxonomic grouping added
     
         summary_data = [
@@ -640,8 +753,7 @@ class BLASTReportGenerator:
         # === Top Species by Hit Count ===
         elements.append(Paragraph("<b>Top Species by Hit Count</b>", self.styles['CustomHeading']))
         
-        species_counts = pd.Series(stats['all_species']).value_counts().to_dict()
-        top_species = sorted(species_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+        top_species = stats['species_counts'].sort_values(ascending=False, kind='stable').head(10).items()
         top_species_data = [["Species", "Hit Count"]] + [[s, str(c)] for s, c in top_species]
         
         species_table = Table(top_species_data, colWidths=[3 * inch, 1.2 * inch])
@@ -660,8 +772,7 @@ class BLASTReportGenerator:
         # === Top Queries by Hit Count ===
         elements.append(Paragraph("<b>Top Queries by Hit Count</b>", self.styles['CustomHeading']))
         
-        query_counts = pd.Series(stats['all_queries']).value_counts().to_dict()
-        top_queries = sorted(query_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+        top_queries = stats['query_counts'].sort_values(ascending=False, kind='stable').head(10).items()
         top_queries_data = [["Query Title", "Hit Count"]] + [[q, str(c)] for q, c in top_queries]
         
         queries_table = Table(top_queries_data, colWidths=[3 * inch, 1.2 * inch])
@@ -680,65 +791,100 @@ class BLASTReportGenerator:
         return elements
 
 
-    def create_file_data_tables(self, dataframes: Dict[str, pd.DataFrame]) -> List[Any]:
-        """Create individual tables for each CSV file with proper formatting."""
-        elements = []
+    def format_hit_rows(self, df: pd.DataFrame) -> List[List[str]]:
+        """Format every table row with column-wise string operations instead of iterrows."""
+        def column(name, fmt):
+            if name not in df.columns:
+                return np.full(len(df), "N/A", dtype=object)
+            return np.char.mod(fmt, df[name].to_numpy(dtype=float, na_value=np.nan)).astype(object)
+
+        if 'subject_title' in df.columns:
+            subject = df['subject_title'].astype(str).str.wrap(40).to_numpy()
+        else:
+            subject = np.full(len(df), "N/A", dtype=object)
+        taxid = df['taxid'].astype(str).to_numpy() if 'taxid' in df.columns else np.full(len(df), "N/A", dtype=object)
+        columns = [subject, taxid, column('identity_pct', '%.1f'), column('bit_score', '%.4f'), column('evalue', '%.6f')]
+        return [list(row) for row in zip(*columns)]
+
+    def create_hit_table(self, rows: List[List[str]]) -> Table:
+        table_data = [["Subject Title", "TaxID", "Identity %", "Bit Score", "E-value"]] + rows
         
-        for filename, df in dataframes.items():
-            # Add section header for this file
-            elements.append(Paragraph(f"Sequence: {filename}", self.styles['CustomHeading']))
-            elements.append(Spacer(1, 0.1*inch))
+        # Create table with optimized column widths
+        table = Table(
+            table_data, 
+            colWidths=[3.5*inch, 0.8*inch, 0.8*inch, 1*inch, 1*inch],
+            repeatRows=1  # Repeat header on each page
+        )
+        
+        # Apply table styling
+        table.setStyle(TableStyle([
+            # Header style
+            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
             
-            # Prepare table data with wrapped text
-            table_data = [["Subject Title", "TaxID", "Identity %", "Bit Score", "E-value"]]
+            # Data row styles
+            ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
             
-            for _, row in df.iterrows():
-                wrapped_subject = self.wrap_text(row['subject_title'], 40) if 'subject_title' in row else "N/A"
-                taxid = str(row['taxid']) if 'taxid' in row else "N/A"
-                identity = f"{row['identity_pct']:.1f}" if 'identity_pct' in row else "N/A"
-                bit_score = f"{row['bit_score']:.4f}" if 'bit_score' in row else "N/A"
-                evalue = f"{row['evalue']:.6f}" if 'evalue' in row else "N/A"
-                
-                table_data.append([wrapped_subject, taxid, identity, bit_score, evalue])
+            # Specific column alignments
+            ('ALIGN', (1, 1), (1, -1), 'CENTER'),  # TaxID centered
+            ('ALIGN', (2, 1), (3, -1), 'CENTER'),  # Numeric columns centered
+        ]))
+        return table
+
+    def iter_file_data_tables(self, dataframes: Dict[str, pd.DataFrame], start: int = 0, limit: int = None, appendix: bool = False):
+        """Yield the per-file sections one page-sized table at a time.
+
+        Only rows start..start+limit of each file are included, and the
+        tables are formatted as the document asks for them, so the whole hit
+        list never has to be laid out in memory at once.
+        """
+        rows_per_table = CONFIG['report_rows_per_table']
+        names = [name for name, df in dataframes.items() if len(df) > start or not appendix]
+        
+        for index, filename in enumerate(names):
+            df = dataframes[filename]
+            shown = df.iloc[start:start + limit] if limit is not None else df.iloc[start:]
             
-            # Create table with optimized column widths
-            table = Table(
-                table_data, 
-                colWidths=[3.5*inch, 0.8*inch, 0.8*inch, 1*inch, 1*inch],
-                repeatRows=1  # Repeat header on each page
-            )
+            # Add section header for this file
+            heading = f"Sequence: {filename}"
+            if appendix:
+                heading += f" (rows {start + 1}-{start + len(shown)})"
+            yield Paragraph(heading, self.styles['CustomHeading'])
+            yield Spacer(1, 0.1*inch)
             
-            # Apply table styling
-            table.setStyle(TableStyle([
-                # Header style
-                ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 9),
-                
-                # Data row styles
-                ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]),
-                
-                # Specific column alignments
-                ('ALIGN', (1, 1), (1, -1), 'CENTER'),  # TaxID centered
-                ('ALIGN', (2, 1), (3, -1), 'CENTER'),  # Numeric columns centered
-            ]))
+            for offset in range(0, len(shown), rows_per_table):
+                yield self.create_hit_table(self.format_hit_rows(shown.iloc[offset:offset + rows_per_table]))
+            if shown.empty:
+                yield self.create_hit_table([])
             
-            elements.append(table)
-            elements.append(Paragraph(f"Total records in {filename}: {len(df):,}", self.styles['CustomBody']))
-            elements.append(Spacer(1, 0.3*inch))
+            yield Paragraph(f"Total records in {filename}: {len(df):,}", self.styles['CustomBody'])
+            if not appendix and len(df) > len(shown):
+                yield Paragraph(f"{len(df) - len(shown):,} more records are listed in the appendix report.", self.styles['CustomBody'])
+            yield Spacer(1, 0.3*inch)
             
             # Add page break if this isn't the last file
-            if filename != list(dataframes.keys())[-1]:
-                elements.append(PageBreak())
+            if index < len(names) - 1:
+                yield PageBreak()
+
+    def create_file_data_tables(self, dataframes: Dict[str, pd.DataFrame]) -> List[Any]:
+        """Create individual tables for each CSV file with proper formatting."""
+        return list(self.iter_file_data_tables(dataframes))
+
+    def iter_report(self, dataframes: Dict[str, pd.DataFrame], stats: Dict[str, Any], row_limit: int = None):
+        # Add summary section
+        yield from self.create_summary_section(stats)
+        yield PageBreak()
         
-        return elements
+        # Add individual file data tables
+        yield from self.iter_file_data_tables(dataframes, limit=row_limit)
 
     def generate_report(self, folder_path: Path) -> str:
         try:
@@ -748,35 +894,63 @@ class BLASTReportGenerator:
             if not dataframes:
                 raise ValueError("No valid CSV files with required columns found")
 
-            stats = self.generate_summary_stats(dataframes)
+            # Per-file summaries of unchanged files come from their sidecars
+            summaries = cached_aggregates(
+                folder_path, "summary", list(dataframes),
+                lambda stems: self.file_summaries({stem: dataframes[stem] for stem in stems})
+            )
+            stats = self.generate_summary_stats(dataframes, summaries)
+            row_limit = CONFIG['report_max_rows_per_query']
 
             # Set up PDF document
             output_path = Path(folder_path) / self.output_filename
-            doc = SimpleDocTemplate(
-                str(output_path),
-                pagesize=A4,
-                topMargin=0.5*inch,
-                bottomMargin=0.5*inch
-            )
-            
-            # Build report elements
-            story = []
-            
-            # Add summary section
-            story.extend(self.create_summary_section(stats))
-            story.append(PageBreak())
-            
-            # Add individual file data tables
-            story.extend(self.create_file_data_tables(dataframes))
-            
-            # Generate PDF
-            doc.build(story)
+            self.build_document(output_path, self.iter_report(dataframes, stats, row_limit))
+
+            # Rows past the per-query cap go to a separate appendix report
+            appendix_path = output_path.with_name(f"{output_path.stem}_Appendix.pdf")
+            if row_limit is not None and any(len(df) > row_limit for df in dataframes.values()):
+                self.build_document(appendix_path, self.iter_file_data_tables(dataframes, start=row_limit, appendix=True))
+            elif appendix_path.exists():
+                appendix_path.unlink()
             
             return str(output_path)
 
         except Exception as e:
             raise
 
+    def build_document(self, output_path: Path, flowables) -> None:
+        doc = SimpleDocTemplate(
+            str(output_path),
+            pagesize=A4,
+            topMargin=0.5*inch,
+            bottomMargin=0.5*inch
+        )
+        doc.build(StreamingStory(flowables))
+
+class StreamingStory(list):
+    """Story list that pulls flowables from a generator as ReportLab consumes it.
+
+    doc.build() checks len() before handling each flowable, so topping the
+    list up there keeps only a few flowables alive at any time.
+    """
+
+    def __init__(self, flowables, lookahead: int = 8):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
+        self._fill()
+
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
 def generate_blast_full_report(folder_path: Path, output_filename: str = "BLAST_Full_Report.pdf") -> str:
     folder = Path(folder_path)
     if not folder.exists():
@@ -0,0 +1,45 @@
+import numpy as np
+
+from CONFIG import *
+from report import anomaly_mask, compile_keywords
+from store import read_hits_csv
+
+# Identity % histogram edges, finest where species level matches are told apart
+IDENTITY_BINS = [0, 70, 80, 85, 90, 95, 97, 99, 100.001]
+TOP_COLUMNS = ["subject_accession", "sci_name", "identity_pct", "evalue", "bit_score"]
+
+
+def _json_value(value):
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def query_frame(query_title, df, pattern, top_n=None):
+    """Compact summary of one query's hits: counts, identity histogram and the top hits"""
+    top_n = top_n or CONFIG['live_top_hits']
+    anomalies = int(anomaly_mask(df['subject_title'], pattern).sum()) if len(df) else 0
+    identity = df['identity_pct'].to_numpy(dtype=float, na_value=np.nan) if len(df) else np.empty(0)
+    histogram = np.histogram(identity[~np.isnan(identity)], bins=IDENTITY_BINS)[0]
+    # Hits keep NCBI's order, best first
+    top = df[TOP_COLUMNS].head(top_n).astype(object).to_numpy().tolist()
+    return {
+        "query": query_title,
+        "hits": len(df),
+        "anomalies": anomalies,
+        "identity": histogram.tolist(),
+        "top": [[_json_value(value) for value in row] for row in top],
+    }
+
+
+def result_frames(csv_paths, settings):
+    """One batch of query frames, the payload of a ["results", batch] progress message"""
+    pattern = compile_keywords([settings.non_anomaly_keyword])
+    frames = []
+    for csv_path in csv_paths:
+        df = read_hits_csv(csv_path)
+        title = df['query_title'].iloc[0] if len(df) else csv_path.stem
+        frames.append(query_frame(title, df, pattern))
+    return {"bins": IDENTITY_BINS[:-1], "columns": TOP_COLUMNS, "queries": frames}
@@ -1,11 +1,18 @@
 from perplexity import Perplexity
 from dotenv import load_dotenv
 
-load_dotenv()
-client = Perplexity()
+_client = None
+
+def get_client():
+    # Created on first use so importing this module needs no API key
+    global _client
+    if _client is None:
+        load_dotenv()
+        _client = Perplexity()
+    return _client
 
 def search(scientific_name):
-    completion = client.chat.completions.create(
+    completion = get_client().chat.completions.create(
         messages=[
             {
                 "role": "system",
@@ -1,9 +1,19 @@
 const host = window.location.host;
 let ws;
-ws = new WebSocket(`ws://${host}`);
-ws.onclose = () => {
+
+// Reconnect on close and catch up with a job that is still running after a reload or dropped connection
+function connect() {
     ws = new WebSocket(`ws://${host}`);
-};
+    ws.onmessage = handleMessage;
+    ws.onopen = () => {
+        const fid = localStorage.getItem('blid');
+        if (fid && localStorage.getItem('blid_running')) {
+            loadResults(fid);
+            ws.send(JSON.stringify(["subscribe", fid]));
+        }
+    };
+    ws.onclose = () => setTimeout(connect, 1000);
+}
 
 const entriesDiv = document.getElementById('entries');
 const previewDiv = document.getElementById('preview');
@@ -24,6 +34,7 @@ const showLoadingBtn = document.getElementById('showLoading');
 // Download buttons
 const downloadFastaBtn = document.getElementById('downloadFasta');
 const downloadFullBtn = document.getElementById('downloadFull');
+const downloadAppendixBtn = document.getElementById('downloadAppendix');
 const downloadAnomalyBtn = document.getElementById('downloadAnomaly');
 const downloadCSVBtn = document.getElementById('downloadCSV');
 
@@ -148,6 +159,12 @@ function downloadFull() {
     window.location.href = `/download?${queryString}`;
 }
 
+function downloadAppendix() {
+    const fid = localStorage.getItem('blid');
+    const queryString = new URLSearchParams({type: 5, folderid: fid}).toString();
+    window.location.href = `/download?${queryString}`;
+}
+
 function downloadCSV() {
     const fid = localStorage.getItem('blid');
     const queryString = new URLSearchParams({type: 1, folderid: fid}).toString();
@@ -239,6 +256,8 @@ uploadArea.addEventListener('drop', (e) => {
 // Download button event listeners
 downloadFastaBtn.addEventListener('click', downloadFasta);
 downloadFullBtn.addEventListener('click', downloadFull);
+// Only on the page when the full report caps its rows
+if (downloadAppendixBtn) downloadAppendixBtn.addEventListener('click', downloadAppendix);
 downloadAnomalyBtn.addEventListener('click', downloadAnomaly);
 downloadCSVBtn.addEventListener('click', downloadCSV);
 
@@ -251,20 +270,132 @@ function updatePDFs(url1, url2) {
   document.getElementById('pdf2').src = url2;
 }
 
+// Live per-query results, the table only keeps the rows in view in the DOM
+const RESULT_ROW_HEIGHT = 28;
+const SPARK = '▁▂▃▄▅▆▇█';
+const resultsPanel = document.getElementById('resultsPanel');
+const resultsViewport = document.getElementById('resultsViewport');
+const resultsSpacer = document.getElementById('resultsSpacer');
+const resultsRows = document.getElementById('resultsRows');
+const resultsCount = document.getElementById('resultsCount');
+const resultsDetail = document.getElementById('resultsDetail');
+const queryResults = new Map();
+let resultOrder = [];
+let resultColumns = [];
+let resultBins = [];
+let selectedQuery = null;
+let resultsRenderPending = false;
+
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+}
+
+function addResultFrames(batch) {
+    resultBins = batch.bins;
+    resultColumns = batch.columns;
+    batch.queries.forEach(frame => {
+        if (!queryResults.has(frame.query)) resultOrder.push(frame.query);
+        queryResults.set(frame.query, frame);
+    });
+    resultsPanel.style.display = 'block';
+    scheduleResultsRender();
+}
+
+function resetResults() {
+    queryResults.clear();
+    resultOrder = [];
+    selectedQuery = null;
+    resultsDetail.innerHTML = '';
+    resultsPanel.style.display = 'none';
+    loadingOverlay.appendChild(resultsPanel);
+}
+
+function scheduleResultsRender() {
+    // Frames can arrive in bursts, draw at most once per animation frame
+    if (resultsRenderPending) return;
+    resultsRenderPending = true;
+    requestAnimationFrame(() => {
+        resultsRenderPending = false;
+        renderVisibleResults();
+    });
+}
+
+function sparkline(counts) {
+    const max = Math.max(...counts, 1);
+    return counts.map(count => SPARK[count ? 1 + Math.floor(count / max * 6.999) : 0]).join('');
+}
+
+function renderVisibleResults() {
+    const total = resultOrder.length;
+    resultsSpacer.style.height = `${total * RESULT_ROW_HEIGHT}px`;
+    resultsCount.textContent = `${total} quer${total === 1 ? 'y' : 'ies'}`;
+    const first = Math.max(0, Math.floor(resultsViewport.scrollTop / RESULT_ROW_HEIGHT) - 5);
+    const last = Math.min(total, Math.ceil((resultsViewport.scrollTop + resultsViewport.clientHeight) / RESULT_ROW_HEIGHT) + 5);
+    resultsRows.style.transform = `translateY(${first * RESULT_ROW_HEIGHT}px)`;
+    resultsRows.innerHTML = resultOrder.slice(first, last).map(query => {
+        const frame = queryResults.get(query);
+        const best = frame.top[0] || [];
+        const bins = frame.identity.map((count, i) => `${resultBins[i]}%+: ${count}`).join(', ');
+        return `
+            <div class="result-row${query === selectedQuery ? ' selected' : ''}" data-query="${escapeHtml(query)}">
+                <span title="${escapeHtml(query)}">${escapeHtml(query)}</span>
+                <span>${frame.hits}</span>
+                <span>${frame.anomalies}</span>
+                <span title="${escapeHtml(best[1])}">${escapeHtml(best[1])}</span>
+                <span>${best[2] ?? ''}</span>
+                <span class="identity-spark" title="${bins}">${sparkline(frame.identity)}</span>
+            </div>`;
+    }).join('');
+}
+
+function showQueryHits(query) {
+    const frame = queryResults.get(query);
+    if (!frame) return;
+    selectedQuery = query;
+    const header = resultColumns.map(column => `<th>${escapeHtml(column)}</th>`).join('');
+    const rows = frame.top.map(row => `<tr>${row.map(value => `<td>${escapeHtml(value)}</td>`).join('')}</tr>`).join('');
+    resultsDetail.innerHTML = `
+        <strong>Top ${frame.top.length} of ${frame.hits} hits for ${escapeHtml(query)}</strong>
+        <table class="table table-sm mb-0"><thead><tr>${header}</tr></thead><tbody>${rows}</tbody></table>`;
+    scheduleResultsRender();
+}
+
+function loadResults(fid) {
+    // A reloaded page gets the queries parsed before it reconnected
+    fetch(`/results?${new URLSearchParams({folderid: fid})}`)
+        .then(response => response.ok ? response.json() : null)
+        .then(batch => { if (batch && batch.queries.length) addResultFrames(batch); })
+        .catch(error => console.error('Results fetch error:', error));
+}
+
+resultsViewport.addEventListener('scroll', scheduleResultsRender);
+resultsRows.addEventListener('click', (e) => {
+    const row = e.target.closest('.result-row');
+    if (row) showQueryHits(row.dataset.query);
+});
+
 const icon = document.getElementById("loadingIcon");
 let finished = 0;
 const result = [];
 
-ws.onmessage = (event) => {
+function handleMessage(event) {
     try {
         const data = JSON.parse(event.data);
+        if (Array.isArray(data) && data[0] === "results") {
+            addResultFrames(data[1]);
+            return;
+        }
         if (data[0] == "folderid") {
             localStorage.setItem("blid", data[1]);
             localStorage.setItem("blid_red", data[1]);
+            localStorage.setItem("blid_running", "1");
         }
         
         if (Array.isArray(data)) {
             if (data[0] && data[0].toLowerCase().includes("complete")) {
+                if (data[0].startsWith("Successfully")) {
+                    localStorage.removeItem("blid_running");
+                }
                 // Update preview with results
                 previewDiv.innerHTML = currentResults.map(
                     (e, i) => `
@@ -276,6 +407,7 @@ ws.onmessage = (event) => {
 
                 hideLoading();
                 downloadSection.style.display = 'block';
+                downloadSection.insertBefore(resultsPanel, document.getElementById('pdfpreview'));
                 downloadSection.scrollIntoView({ behavior: 'smooth' });
 
                 let url = window.location.origin;
@@ -289,6 +421,7 @@ ws.onmessage = (event) => {
 
             }
             else if (data[0] && data[0].toLowerCase().includes("error")) {
+                localStorage.removeItem("blid_running");
                 icon.className = "bi bi-x-circle-fill";
                 icon.style.color = "red";
                 loadingTitle.textContent = data[0];
@@ -381,7 +514,13 @@ ws.onmessage = (event) => {
             }
         }
     }
-};
+}
+
+connect();
+if (localStorage.getItem('blid_running')) {
+    showLoading();
+    loadingTitle.textContent = "Reconnecting to your BLAST job";
+}
 
 document.getElementById('submitAll').addEventListener('click', () => {
     let allTitlesFilled = true;
@@ -412,6 +551,7 @@ document.getElementById('submitAll').addEventListener('click', () => {
     currentResults = result;
 
     // Show loading during "processing"
+    resetResults();
     showLoading();
     loadingTitle.textContent = "Submitting DNA Sequences";
     loadingDescription.textContent = "Performing BLAST analysis and report generation...";
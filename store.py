@@ -0,0 +1,145 @@
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from aggregates import file_digest
+from parallel import map_files
+
+STORE_NAME = "results.parquet"
+
+STRING_COLUMNS = ["query_id", "subject_id", "subject_accession", "subject_title"]
+CATEGORY_COLUMNS = ["query_title", "sci_name"]
+FLOAT_COLUMNS = ["identity_pct", "bit_score", "evalue", "query_coverage", "total_bit_score", "best_evalue", "merged_identity_pct"]
+INT_COLUMNS = ["taxid", "hsp_count"]
+
+# Same column order as the per-query CSVs, plus the file each hit came from
+SCHEMA = pa.schema([
+    ("source", pa.dictionary(pa.int32(), pa.string())),
+    ("query_id", pa.string()),
+    ("query_title", pa.dictionary(pa.int32(), pa.string())),
+    ("subject_id", pa.string()),
+    ("subject_accession", pa.string()),
+    ("subject_title", pa.string()),
+    ("taxid", pa.int64()),
+    ("sci_name", pa.dictionary(pa.int32(), pa.string())),
+    ("identity_pct", pa.float64()),
+    ("bit_score", pa.float64()),
+    ("evalue", pa.float64()),
+    ("hsp_count", pa.int64()),
+    ("query_coverage", pa.float64()),
+    ("total_bit_score", pa.float64()),
+    ("best_evalue", pa.float64()),
+    ("merged_identity_pct", pa.float64()),
+])
+
+
+def read_hits_csv(csv_path):
+    """Read one per-query CSV with the store's column types"""
+    df = pd.read_csv(
+        csv_path,
+        dtype={name: str for name in STRING_COLUMNS + CATEGORY_COLUMNS},
+        keep_default_na=False,
+        na_values={name: [""] for name in FLOAT_COLUMNS + INT_COLUMNS},
+        float_precision="round_trip"
+    )
+    for name in INT_COLUMNS:
+        if name in df.columns:
+            df[name] = pd.to_numeric(df[name], errors="coerce").astype("Int64")
+    return df
+
+
+def write_result_store(folder_path):
+    """Collect the per-query CSVs of a job into one typed Parquet file.
+
+    Rows of CSVs whose content is the same as when the previous store was
+    written are kept from it, only new or rewritten CSVs are parsed again.
+    """
+    folder = Path(folder_path)
+    csv_files = sorted(folder.glob("*.csv"))
+    if not csv_files:
+        raise FileNotFoundError(f"No CSV files found in {folder_path}")
+
+    store_path = folder / STORE_NAME
+    digests = {csv_file.stem: file_digest(csv_file) for csv_file in csv_files}
+    stored = stored_digests(store_path)
+    reuse = [stem for stem, digest in digests.items() if stored.get(stem) == digest]
+    frames = [read_store(folder, reuse)] if reuse else []
+    reused = set(reuse)
+    csv_files_to_read = [csv_file for csv_file in csv_files if csv_file.stem not in reused]
+
+    for csv_file, df in zip(csv_files_to_read, map_files(read_hits_csv, csv_files_to_read)):
+        df.insert(0, "source", csv_file.stem)
+        frames.append(df)
+    combined = pd.concat(frames, ignore_index=True).reindex(columns=SCHEMA.names)
+    # Same row order as a store built from scratch, whichever CSVs were parsed this time
+    order = {csv_file.stem: i for i, csv_file in enumerate(csv_files)}
+    combined = combined.iloc[combined["source"].astype(str).map(order).argsort(kind="stable")].reset_index(drop=True)
+    # CSVs written before the HSP aggregates existed (or restored from the cache) lack those columns
+    for name in INT_COLUMNS:
+        combined[name] = combined[name].astype("Int64")
+
+    table = pa.Table.from_pandas(combined, schema=SCHEMA, preserve_index=False)
+    # Queries without hits have no rows, keep the full ordered file list in the metadata
+    # with the content digest of each, a CSV rewritten within the same mtime tick still counts as changed
+    metadata = {
+        b"sources": json.dumps([csv_file.stem for csv_file in csv_files]).encode("utf-8"),
+        b"digests": json.dumps(digests).encode("utf-8"),
+    }
+    table = table.replace_schema_metadata(metadata)
+
+    # Per-process temp name, two report workers may rebuild a stale store at once
+    tmp_path = folder / f"{STORE_NAME}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(store_path)
+    return store_path
+
+
+def stored_digests(store_path):
+    """{file stem: content digest} of the CSVs a store was built from, empty when there is no usable store"""
+    if not Path(store_path).exists():
+        return {}
+    metadata = pq.read_schema(store_path).metadata or {}
+    # Stores written before digests were recorded are rebuilt once
+    return json.loads(metadata[b"digests"]) if b"digests" in metadata else {}
+
+
+def store_is_fresh(folder_path):
+    """The store holds exactly the current CSVs, none added, deleted or rewritten since it was written"""
+    folder = Path(folder_path)
+    stored = stored_digests(folder / STORE_NAME)
+    csv_files = sorted(folder.glob("*.csv"))
+    if not stored or sorted(stored) != [csv_file.stem for csv_file in csv_files]:
+        return False
+    return all(stored[csv_file.stem] == file_digest(csv_file) for csv_file in csv_files)
+
+
+def read_store(folder_path, sources=None):
+    """The store's rows as one DataFrame, only those of `sources` when given"""
+    combined = pq.read_table(Path(folder_path) / STORE_NAME).to_pandas()
+    if sources is not None:
+        combined = combined[combined["source"].isin(sources)].reset_index(drop=True)
+    return combined
+
+
+def load_results(folder_path, sources=None):
+    """Return the job's hits as {file stem: DataFrame} in file name order, rebuilding a stale store.
+
+    With `sources` only those files are returned.
+    """
+    folder = Path(folder_path)
+    if not store_is_fresh(folder):
+        write_result_store(folder)
+
+    all_sources = json.loads(pq.read_schema(folder / STORE_NAME).metadata[b"sources"])
+    if sources is not None:
+        wanted = set(sources)
+        all_sources = [source for source in all_sources if source in wanted]
+    combined = read_store(folder, None if sources is None else all_sources)
+
+    grouped = {source: df.drop(columns="source") for source, df in combined.groupby("source", sort=False, observed=True)}
+    empty = combined.drop(columns="source").iloc[0:0]
+    return {source: grouped.get(source, empty).reset_index(drop=True) for source in all_sources}
@@ -0,0 +1,185 @@
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from CONFIG import *
+
+# Ranks whose ancestor is stored per taxid at build time, any other rank walks the parents
+MAJOR_RANKS = ["superkingdom", "kingdom", "phylum", "class", "order", "family", "genus", "species"]
+MAX_DEPTH = 128
+
+
+def read_dmp(path, columns):
+    """Read the given columns of an NCBI .dmp file (fields separated by tab, pipe, tab)"""
+    df = pd.read_csv(
+        path, sep="|", header=None, usecols=columns, dtype=str,
+        quoting=3, keep_default_na=False, engine="c"
+    )
+    return [df[column].str.strip() for column in columns]
+
+
+def build_taxdump_index(dump_dir=None, index_dir=None):
+    """Turn names.dmp and nodes.dmp into flat arrays indexed by taxid.
+
+    parent.npy, rank.npy and name_offsets.npy hold one entry per taxid.
+    names.bin holds the scientific names back to back, and anc_<rank>.npy
+    holds the ancestor at each major rank. Everything is loaded memory mapped.
+    """
+    dump_dir = Path(dump_dir or CONFIG['taxdump_dir'])
+    index_dir = Path(index_dir or CONFIG['taxdump_index_dir'])
+    index_dir.mkdir(parents=True, exist_ok=True)
+
+    node_ids, parent_ids, ranks = read_dmp(dump_dir / "nodes.dmp", [0, 1, 2])
+    node_ids = node_ids.astype(np.int64).to_numpy()
+    size = int(node_ids.max()) + 1
+
+    parent = np.full(size, -1, dtype=np.int32)
+    parent[node_ids] = parent_ids.astype(np.int64).to_numpy()
+    rank_codes, rank_names = pd.factorize(ranks)
+    rank = np.full(size, -1, dtype=np.int16)
+    rank[node_ids] = rank_codes
+
+    name_ids, names, name_classes = read_dmp(dump_dir / "names.dmp", [0, 1, 3])
+    scientific = (name_classes == "scientific name").to_numpy()
+    name_ids = name_ids[scientific].astype(np.int64).to_numpy()
+    encoded = [name.encode("utf-8") for name in names[scientific]]
+    lengths = np.fromiter((len(name) for name in encoded), dtype=np.int64, count=len(encoded))
+    starts = np.zeros(len(encoded), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    name_offsets = np.zeros((size, 2), dtype=np.int64)
+    name_offsets[name_ids, 0] = starts
+    name_offsets[name_ids, 1] = starts + lengths
+    (index_dir / "names.bin").write_bytes(b"".join(encoded))
+
+    # Walk every taxid up to the root at once, noting the first ancestor at each major rank
+    ancestors = {name: np.full(size, -1, dtype=np.int32) for name in MAJOR_RANKS}
+    codes = {name: code for code, name in enumerate(rank_names)}
+    current = np.arange(size, dtype=np.int32)
+    valid = parent >= 0
+    for _ in range(MAX_DEPTH):
+        current_rank = rank[current]
+        for name, found in ancestors.items():
+            if name in codes:
+                hit = valid & (found < 0) & (current_rank == codes[name])
+                found[hit] = current[hit]
+        up = parent[current]
+        moving = valid & (up != current)
+        if not moving.any():
+            break
+        current = np.where(moving, up, current)
+
+    np.save(index_dir / "parent.npy", parent)
+    np.save(index_dir / "rank.npy", rank)
+    np.save(index_dir / "name_offsets.npy", name_offsets)
+    for name, found in ancestors.items():
+        np.save(index_dir / f"anc_{name}.npy", found)
+    (index_dir / "ranks.json").write_text(json.dumps(list(rank_names)))
+    return index_dir
+
+
+class TaxonomyIndex:
+    """Memory mapped taxid -> parent, rank, scientific name and major rank ancestors"""
+
+    def __init__(self, index_dir=None):
+        index_dir = Path(index_dir or CONFIG['taxdump_index_dir'])
+        self.parent = np.load(index_dir / "parent.npy", mmap_mode="r")
+        self.rank = np.load(index_dir / "rank.npy", mmap_mode="r")
+        self.name_offsets = np.load(index_dir / "name_offsets.npy", mmap_mode="r")
+        self.names = np.memmap(index_dir / "names.bin", dtype=np.uint8, mode="r")
+        self.rank_names = json.loads((index_dir / "ranks.json").read_text())
+        self.rank_codes = {name: code for code, name in enumerate(self.rank_names)}
+        self.ancestors = {
+            name: np.load(index_dir / f"anc_{name}.npy", mmap_mode="r") for name in MAJOR_RANKS
+        }
+
+    def _ids(self, taxids):
+        """Taxids as an int array, unknown or missing ones mapped to -1"""
+        taxids = pd.to_numeric(pd.Series(taxids, dtype=object), errors="coerce").fillna(-1).to_numpy(np.int64)
+        known = (taxids >= 0) & (taxids < len(self.parent))
+        known[known] = self.parent[taxids[known]] >= 0
+        return np.where(known, taxids, -1)
+
+    def name(self, taxid):
+        if taxid < 0 or taxid >= len(self.parent):
+            return None
+        start, end = self.name_offsets[taxid]
+        return bytes(self.names[start:end]).decode("utf-8") if end > start else None
+
+    def rank_of(self, taxid):
+        if taxid < 0 or taxid >= len(self.rank) or self.rank[taxid] < 0:
+            return None
+        return self.rank_names[self.rank[taxid]]
+
+    def lineage(self, taxid):
+        """[(rank, name), ...] from the root down to the taxid itself"""
+        lineage = []
+        current = int(taxid)
+        for _ in range(MAX_DEPTH):
+            if current < 0 or current >= len(self.parent) or self.parent[current] < 0:
+                break
+            lineage.append((self.rank_of(current), self.name(current)))
+            up = int(self.parent[current])
+            if up == current:
+                break
+            current = up
+        return lineage[::-1]
+
+    def ancestor_at(self, taxids, rank):
+        """Vectorized taxid -> ancestor taxid at `rank` (the taxid itself counts), -1 when there is none"""
+        ids = self._ids(taxids)
+        known = ids >= 0
+        result = np.full(len(ids), -1, dtype=np.int64)
+        if rank in self.ancestors:
+            result[known] = self.ancestors[rank][ids[known]]
+            return result
+        code = self.rank_codes.get(rank)
+        if code is None:
+            return result
+        current = ids.copy()
+        for _ in range(MAX_DEPTH):
+            active = known & (result < 0)
+            if not active.any():
+                break
+            hit = active & (self.rank[current.clip(0)] == code)
+            result[hit] = current[hit]
+            up = np.where(active, self.parent[current.clip(0)], current)
+            known &= up != current
+            current = up
+        return result
+
+    def names_of(self, taxids):
+        """Scientific name of every taxid, None for unknown ones, each distinct taxid decoded once"""
+        taxids = np.asarray(taxids, dtype=np.int64)
+        uniques, codes = np.unique(taxids, return_inverse=True)
+        names = np.array([self.name(int(taxid)) for taxid in uniques], dtype=object)
+        return names[codes.reshape(-1)]
+
+    def group_names(self, taxids, rank):
+        """Name of the ancestor at `rank` for every taxid, None where it is unknown"""
+        return self.names_of(self.ancestor_at(taxids, rank))
+
+
+def index_version():
+    """mtime of the built index, None when there is none, anything derived from the index keys on it"""
+    ranks_path = Path(CONFIG['taxdump_index_dir']) / "ranks.json"
+    return ranks_path.stat().st_mtime_ns if ranks_path.exists() else None
+
+
+_index = None
+
+def get_taxonomy_index():
+    """The shared index, None when no index has been built"""
+    global _index
+    if _index is None:
+        if not (Path(CONFIG['taxdump_index_dir']) / "ranks.json").exists():
+            return None
+        _index = TaxonomyIndex()
+    return _index
+
+
+if __name__ == "__main__":
+    dump_dir = sys.argv[1] if len(sys.argv) > 1 else None
+    print(f"Taxonomy index written to {build_taxdump_index(dump_dir)}")